@@ -0,0 +1,252 @@
+import argparse
+import gzip
+import json
+import logging
+import os
+import re
+from datetime import datetime
+from typing import Iterator, List, Optional, Tuple
+
+from sqlalchemy import column, func, select, table, text
+from sqlalchemy.engine import Connection
+from dotenv import load_dotenv
+
+from . import models
+from .database import engine
+from .export import _encode_ndjson
+
+load_dotenv()
+# compressed NDJSON files, one per archived month
+ACTIVITY_ARCHIVE_DIR = os.getenv("ACTIVITY_ARCHIVE_DIR", "archive")
+# months kept in the database (the current month included); older months are archived and dropped
+ACTIVITY_RETENTION_MONTHS = int(os.getenv("ACTIVITY_RETENTION_MONTHS", "6"))
+# PostgreSQL: monthly partitions created ahead of time
+ACTIVITY_PARTITIONS_AHEAD = int(os.getenv("ACTIVITY_PARTITIONS_AHEAD", "2"))
+ARCHIVE_CHUNK_SIZE = 5000
+
+logger = logging.getLogger(__name__)
+
+Month = Tuple[int, int]
+
+_MONTH_TABLE = re.compile(r"^activities_(\d{4})_(\d{2})$")
+_ARCHIVE_FILE = re.compile(r"^activities-(\d{4})-(\d{2})\.ndjson\.gz$")
+_COLUMNS = [c.key for c in models.Activity.__table__.columns]
+
+def _shift(month: Month, months: int) -> Month:
+    index = month[0] * 12 + month[1] - 1 + months
+    return index // 12, index % 12 + 1
+
+def _start(month: Month) -> datetime:
+    return datetime(month[0], month[1], 1)
+
+def _current() -> Month:
+    now = datetime.utcnow()
+    return now.year, now.month
+
+def _table_name(month: Month) -> str:
+    return f"activities_{month[0]:04d}_{month[1]:02d}"
+
+def _month_table(month: Month):
+    # lightweight handle with the model's column types, for PostgreSQL partitions
+    return table(_table_name(month), *[column(c.key, c.type) for c in models.Activity.__table__.columns])
+
+def archive_path(month: Month) -> str:
+    return os.path.join(ACTIVITY_ARCHIVE_DIR, f"activities-{month[0]:04d}-{month[1]:02d}.ndjson.gz")
+
+def is_partitioned(conn: Connection) -> bool:
+    if conn.dialect.name != "postgresql":
+        return False
+    return conn.execute(text("SELECT relkind FROM pg_class WHERE relname = 'activities'")).scalar() == "p"
+
+def _month_tables(conn: Connection) -> List[Month]:
+    # monthly partitions of a PostgreSQL activities table
+    names = conn.execute(text(
+        "SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid "
+        "JOIN pg_class p ON p.oid = i.inhparent WHERE p.relname = 'activities'"
+    )).scalars()
+    months = []
+    for name in names:
+        match = _MONTH_TABLE.match(name)
+        if match:
+            months.append((int(match.group(1)), int(match.group(2))))
+    return sorted(months)
+
+def _create_partition(conn: Connection, month: Month):
+    conn.execute(text(
+        f"CREATE TABLE IF NOT EXISTS {_table_name(month)} PARTITION OF activities "
+        f"FOR VALUES FROM ('{_start(month).isoformat()}') TO ('{_start(_shift(month, 1)).isoformat()}')"
+    ))
+
+def partition():
+    # one-off PostgreSQL conversion of a plain activities table into monthly range partitions
+    with engine.begin() as conn:
+        if conn.dialect.name != "postgresql":
+            raise SystemExit("native partitioning needs PostgreSQL; on SQLite `maintain` archives straight from the activities table")
+        if is_partitioned(conn):
+            print("activities is already partitioned")
+            return
+        first = conn.execute(text("SELECT min(created_at) FROM activities")).scalar()
+        conn.execute(text("ALTER TABLE activities RENAME TO activities_unpartitioned"))
+        conn.execute(text("ALTER INDEX IF EXISTS ix_activities_created_id RENAME TO ix_activities_unpartitioned_created_id"))
+        conn.execute(text("ALTER INDEX IF EXISTS ix_activities_id RENAME TO ix_activities_unpartitioned_id"))
+        conn.execute(text(
+            "CREATE TABLE activities (LIKE activities_unpartitioned INCLUDING DEFAULTS) PARTITION BY RANGE (created_at)"
+        ))
+        # the id sequence must survive dropping the old table
+        conn.execute(text("ALTER SEQUENCE activities_id_seq OWNED BY activities.id"))
+        conn.execute(text("ALTER TABLE activities ALTER COLUMN created_at SET NOT NULL"))
+        conn.execute(text("ALTER TABLE activities ADD PRIMARY KEY (id, created_at)"))
+        month = (first.year, first.month) if first else _current()
+        while month <= _shift(_current(), ACTIVITY_PARTITIONS_AHEAD):
+            _create_partition(conn, month)
+            month = _shift(month, 1)
+        conn.execute(text("CREATE TABLE activities_default PARTITION OF activities DEFAULT"))
+        conn.execute(text("INSERT INTO activities SELECT * FROM activities_unpartitioned WHERE created_at IS NOT NULL"))
+        conn.execute(text("DROP TABLE activities_unpartitioned"))
+        conn.execute(text("CREATE INDEX ix_activities_created_id ON activities (created_at, id)"))
+        conn.execute(text("CREATE INDEX ix_activities_id ON activities (id)"))
+        conn.execute(text("ALTER TABLE activities ADD FOREIGN KEY (actor_id) REFERENCES users (id) ON DELETE SET NULL"))
+        conn.execute(text("ALTER TABLE activities ADD FOREIGN KEY (target_post_id) REFERENCES posts (id) ON DELETE SET NULL"))
+    print("activities partitioned by month")
+
+def _write_archive(conn: Connection, month: Month, rows) -> int:
+    # rows: a select of the month's activities in id order
+    os.makedirs(ACTIVITY_ARCHIVE_DIR, exist_ok=True)
+    path = archive_path(month)
+    written = 0
+    archived_max = None
+    # write to a temporary name and rename, so a crash never leaves a truncated archive in place
+    with gzip.open(path + ".tmp", "wt", encoding="utf-8") as out:
+        if os.path.exists(path):
+            # kept: SQLite holds the newest row back, so a month can be archived in two passes. Rows the file already
+            # has are skipped, so a rerun after a crash between the rename and the delete or DROP adds no duplicates
+            with gzip.open(path, "rt", encoding="utf-8") as previous:
+                for line in previous:
+                    out.write(line)
+                    archived_max = max(archived_max or 0, json.loads(line)["id"])
+        if archived_max is not None:
+            rows = rows.where(rows.selected_columns.id > archived_max)
+        result = conn.execution_options(stream_results=True, yield_per=ARCHIVE_CHUNK_SIZE).execute(rows)
+        for chunk in result.partitions(ARCHIVE_CHUNK_SIZE):
+            out.write(_encode_ndjson(_COLUMNS, chunk))
+            written += len(chunk)
+    os.replace(path + ".tmp", path)
+    return written
+
+def _expire_sqlite(conn: Connection, oldest_kept: Month) -> dict:
+    # archive and delete whole expired months straight from activities, so every retained row stays where the feeds,
+    # exports and stream replay read; the newest row always stays behind so SQLite never hands out a used id again
+    cutoff = _start(oldest_kept)
+    activities = models.Activity.__table__
+    newest = select(func.max(activities.c.id)).scalar_subquery()
+    archived = {}
+    while True:
+        expired = conn.execute(
+            select(activities.c.created_at).where(activities.c.created_at < cutoff, activities.c.id < newest)
+            .order_by(activities.c.created_at).limit(1)
+        ).scalar()
+        if expired is None:
+            return archived
+        month = (expired.year, expired.month)
+        in_month = (
+            (activities.c.created_at >= _start(month)) & (activities.c.created_at < _start(_shift(month, 1)))
+            & (activities.c.id < newest)
+        )
+        # rows are only deleted once their archive file is complete
+        archived[_table_name(month)] = _write_archive(
+            conn, month, select(*activities.columns).where(in_month).order_by(activities.c.id)
+        )
+        conn.execute(activities.delete().where(in_month))
+        conn.commit()
+
+def maintain() -> dict:
+    # create upcoming partitions, then archive and drop months past retention
+    summary = {"created": [], "archived": {}}
+    oldest_kept = _shift(_current(), -(ACTIVITY_RETENTION_MONTHS - 1))
+    with engine.connect() as conn:
+        if conn.dialect.name == "sqlite":
+            summary["archived"] = _expire_sqlite(conn, oldest_kept)
+            return summary
+        if conn.dialect.name != "postgresql":
+            return summary
+        if not is_partitioned(conn):
+            logger.warning("activities is not partitioned; run `python -m app.activity_archive partition` first")
+            return summary
+        existing = set(_month_tables(conn))
+        for ahead in range(ACTIVITY_PARTITIONS_AHEAD + 1):
+            month = _shift(_current(), ahead)
+            if month not in existing:
+                _create_partition(conn, month)
+                summary["created"].append(_table_name(month))
+        conn.commit()
+        for month in _month_tables(conn):
+            if month >= oldest_kept:
+                continue
+            # the partition is only dropped once its archive file is complete
+            source = _month_table(month)
+            summary["archived"][_table_name(month)] = _write_archive(
+                conn, month, select(*source.columns).order_by(source.c.id)
+            )
+            conn.execute(text(f"ALTER TABLE activities DETACH PARTITION {_table_name(month)}"))
+            conn.execute(text(f"DROP TABLE {_table_name(month)}"))
+            conn.commit()
+    return summary
+
+def archived_months() -> List[dict]:
+    if not os.path.isdir(ACTIVITY_ARCHIVE_DIR):
+        return []
+    months = []
+    for name in sorted(os.listdir(ACTIVITY_ARCHIVE_DIR)):
+        match = _ARCHIVE_FILE.match(name)
+        if match:
+            path = os.path.join(ACTIVITY_ARCHIVE_DIR, name)
+            months.append({"month": f"{match.group(1)}-{match.group(2)}", "bytes": os.path.getsize(path)})
+    return months
+
+def query_archive(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    verb: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    target_user_id: Optional[int] = None,
+    target_post_id: Optional[int] = None,
+    limit: int = 1000,
+) -> Iterator[str]:
+    # stream matching NDJSON lines, opening only the months that overlap [since, until)
+    wanted = {"verb": verb, "actor_id": actor_id, "target_user_id": target_user_id, "target_post_id": target_post_id}
+    wanted = {key: value for key, value in wanted.items() if value is not None}
+    sent = 0
+    for entry in archived_months():
+        month = tuple(map(int, entry["month"].split("-")))
+        if (since and _start(_shift(month, 1)) <= since) or (until and _start(month) >= until):
+            continue
+        with gzip.open(archive_path(month), "rt", encoding="utf-8") as f:
+            for line in f:
+                row = json.loads(line)
+                created_at = datetime.fromisoformat(row["created_at"]) if row.get("created_at") else None
+                if since and (created_at is None or created_at < since):
+                    continue
+                if until and (created_at is None or created_at >= until):
+                    continue
+                if any(row.get(key) != value for key, value in wanted.items()):
+                    continue
+                yield line
+                sent += 1
+                if sent >= limit:
+                    return
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Partition and archive the activities table")
+    parser.add_argument("command", choices=("partition", "maintain", "list"),
+                        help="partition: one-off PostgreSQL conversion; maintain: run retention (e.g. from cron); list: archived months")
+    args = parser.parse_args(argv)
+    if args.command == "partition":
+        partition()
+    elif args.command == "maintain":
+        print(json.dumps(maintain()))
+    else:
+        for entry in archived_months():
+            print(f"{entry['month']}: {entry['bytes']} bytes")
+
+if __name__ == "__main__":
+    main()
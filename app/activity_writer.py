@@ -0,0 +1,155 @@
+import logging
+import os
+import queue
+import threading
+import time
+from datetime import datetime
+from typing import List, Optional
+
+from sqlalchemy import event, insert
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import instrumentation, models
+from .broker import activity_event, broker
+from .database import SessionLocal, engine
+
+load_dotenv()
+# "sync": Activity rows are written in the caller's transaction
+# "batched": rows are queued after the caller commits and flushed with multi-row INSERTs
+ACTIVITY_WRITE_MODE = os.getenv("ACTIVITY_WRITE_MODE", "sync")
+ACTIVITY_BATCH_SIZE = int(os.getenv("ACTIVITY_BATCH_SIZE", "500"))
+ACTIVITY_FLUSH_INTERVAL_MS = int(os.getenv("ACTIVITY_FLUSH_INTERVAL_MS", "200"))
+ACTIVITY_QUEUE_MAX = int(os.getenv("ACTIVITY_QUEUE_MAX", "10000"))
+# a failed batch is retried this many times, waiting ACTIVITY_RETRY_BACKOFF_MS and doubling each time, before its rows
+# are dropped and counted in activities_dropped_total
+ACTIVITY_FLUSH_RETRIES = int(os.getenv("ACTIVITY_FLUSH_RETRIES", "3"))
+ACTIVITY_RETRY_BACKOFF_MS = int(os.getenv("ACTIVITY_RETRY_BACKOFF_MS", "100"))
+
+logger = logging.getLogger(__name__)
+
+_PENDING_KEY = "pending_activities"
+_ADDED_KEY = "added_activities"
+_PUBLISH_KEY = "publish_activities"
+
+class BatchedActivityWriter:
+    def __init__(self, batch_size: int = ACTIVITY_BATCH_SIZE, flush_interval: float = ACTIVITY_FLUSH_INTERVAL_MS / 1000, maxsize: int = ACTIVITY_QUEUE_MAX):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue: "queue.Queue[Optional[dict]]" = queue.Queue(maxsize=maxsize)
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def start(self):
+        with self._lock:
+            if self._thread and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name="activity-writer", daemon=True)
+            self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        with self._lock:
+            thread = self._thread
+            self._thread = None
+        if thread and thread.is_alive():
+            self._queue.put(None)
+            thread.join(timeout)
+
+    def enqueue(self, rows: List[dict]):
+        if not self._thread:
+            self.start()
+        for row in rows:
+            self._queue.put(row)
+
+    def _run(self):
+        batch: List[dict] = []
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                row = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                row = False
+            if row is None:
+                self._drain(batch)
+                self._flush(batch)
+                return
+            if row:
+                batch.append(row)
+            if len(batch) >= self.batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                batch = []
+                deadline = time.monotonic() + self.flush_interval
+
+    def _drain(self, batch: List[dict]):
+        while True:
+            try:
+                row = self._queue.get_nowait()
+            except queue.Empty:
+                return
+            if row:
+                batch.append(row)
+
+    def _insert(self, batch: List[dict]) -> list:
+        table = models.Activity.__table__
+        with engine.begin() as conn:
+            stmt = insert(table).values(batch)
+            if conn.dialect.full_returning:
+                return conn.execute(stmt.returning(*table.columns)).mappings().all()
+            # SQLite serializes writers, so one multi-row INSERT receives consecutive rowids
+            last_id = conn.execute(stmt).lastrowid
+            return [dict(row, id=last_id - len(batch) + 1 + i) for i, row in enumerate(batch)]
+
+    def _flush(self, batch: List[dict]):
+        if not batch:
+            return
+        backoff = ACTIVITY_RETRY_BACKOFF_MS / 1000
+        for attempt in range(ACTIVITY_FLUSH_RETRIES + 1):
+            try:
+                rows = self._insert(batch)
+                break
+            except Exception:
+                if attempt == ACTIVITY_FLUSH_RETRIES:
+                    logger.exception("dropping %d activities after %d attempts", len(batch), attempt + 1)
+                    instrumentation.record_dropped_activities(len(batch))
+                    return
+                # transient lock or connection errors usually clear; the queue absorbs new rows meanwhile
+                logger.warning("failed to write %d activities, retrying in %.2fs", len(batch), backoff, exc_info=True)
+                time.sleep(backoff)
+                backoff *= 2
+        broker.publish(activity_event(row) for row in rows)
+
+writer = BatchedActivityWriter()
+
+def record(db: Session, verb: models.ActivityType, actor_id: Optional[int] = None, target_user_id: Optional[int] = None, target_post_id: Optional[int] = None, extra: Optional[str] = None):
+    row = dict(actor_id=actor_id, verb=verb, target_user_id=target_user_id, target_post_id=target_post_id, created_at=datetime.utcnow(), extra=extra)
+    if ACTIVITY_WRITE_MODE == "batched":
+        db.info.setdefault(_PENDING_KEY, []).append(row)
+    else:
+        activity = models.Activity(**row)
+        db.add(activity)
+        db.info.setdefault(_ADDED_KEY, []).append(activity)
+
+@event.listens_for(SessionLocal, "after_flush")
+def _capture_flushed(session, flush_context):
+    # ids exist from here on; attributes expire at commit, so snapshot the events now
+    added = session.info.pop(_ADDED_KEY, None)
+    if added:
+        session.info.setdefault(_PUBLISH_KEY, []).extend(activity_event(a) for a in added)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _enqueue_pending(session):
+    rows = session.info.pop(_PENDING_KEY, None)
+    if rows:
+        writer.enqueue(rows)
+    events = session.info.pop(_PUBLISH_KEY, None)
+    if events:
+        broker.publish(events)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_pending(session):
+    session.info.pop(_PENDING_KEY, None)
+    session.info.pop(_ADDED_KEY, None)
+    session.info.pop(_PUBLISH_KEY, None)
+
+def shutdown():
+    writer.stop()
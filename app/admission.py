@@ -0,0 +1,205 @@
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from collections import deque
+from typing import Dict, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+ADMISSION_CONTROL = os.getenv("ADMISSION_CONTROL", "true").lower() in ("1", "true", "yes")
+# class:initial/max concurrency; auth and write stay well under the 40-thread pool so reads always find a thread
+ADMISSION_LIMITS = os.getenv("ADMISSION_LIMITS", "auth:4/8,write:16/24,read:32/64")
+ADMISSION_MIN_LIMIT = int(os.getenv("ADMISSION_MIN_LIMIT", "2"))
+# how long a request may wait for a slot, and how many may wait per class, before it is shed
+ADMISSION_QUEUE_TIMEOUT_MS = float(os.getenv("ADMISSION_QUEUE_TIMEOUT_MS", "200"))
+ADMISSION_QUEUE_MAX = int(os.getenv("ADMISSION_QUEUE_MAX", "64"))
+ADMISSION_SHED_STATUS = int(os.getenv("ADMISSION_SHED_STATUS", "503"))
+# latency may grow this far past its long-run average before the limit starts shrinking
+ADMISSION_TOLERANCE = float(os.getenv("ADMISSION_TOLERANCE", "1.5"))
+
+# long-lived or operational endpoints that must not hold (or wait for) a slot
+EXEMPT_PATHS = ("/metrics", "/docs", "/redoc", "/openapi.json", "/api/activities/stream", "/api/admin/stats/admission")
+# streaming admin downloads run for minutes; in the read class they would pin slots and their latencies would drag
+# the read limit down
+EXEMPT_PREFIXES = ("/api/admin/export/", "/api/admin/archive/activities/query")
+AUTH_PATHS = ("/api/users/login", "/api/users/signup")
+
+def route_class(method: str, path: str) -> Optional[str]:
+    if path in EXEMPT_PATHS or path.startswith(EXEMPT_PREFIXES):
+        return None
+    if path in AUTH_PATHS:
+        return "auth"
+    if method in ("GET", "HEAD", "OPTIONS"):
+        return "read"
+    return "write"
+
+# concurrency limit steered by the ratio of long-run to recent latency: it grows by about sqrt(limit) while requests
+# are no slower than usual and shrinks in proportion when they slow down, so a saturated class sheds instead of
+# stacking more work on a struggling database
+class GradientLimiter:
+    def __init__(self, name: str, initial: int, maximum: int, minimum: int = ADMISSION_MIN_LIMIT):
+        self.name = name
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self.long_rtt: Optional[float] = None
+        self.short_rtt: Optional[float] = None
+        self.admitted = 0
+        self.shed = 0
+        self._waiters: deque = deque()
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> bool:
+        if self.in_flight < int(self.limit):
+            self.in_flight += 1
+            self.admitted += 1
+            return True
+        return False
+
+    async def acquire(self, timeout: float) -> bool:
+        with self._lock:
+            if not self._waiters and self._try_acquire():
+                return True
+            if len(self._waiters) >= ADMISSION_QUEUE_MAX:
+                self.shed += 1
+                return False
+            # the app may be driven from several event loops (e.g. test clients), so waiters are woken thread-safely
+            loop = asyncio.get_running_loop()
+            waiter = (loop, loop.create_future())
+            self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter[1]), timeout)
+            return True
+        except asyncio.TimeoutError:
+            with self._lock:
+                if waiter not in self._waiters:
+                    # granted just as the wait expired; the slot is already ours
+                    return True
+                self._waiters.remove(waiter)
+                self.shed += 1
+            return False
+        except BaseException:
+            # client went away while queued: give back a slot that may already have been granted
+            with self._lock:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                    granted = False
+                else:
+                    granted = True
+            if granted:
+                self.release(None)
+            raise
+
+    def release(self, latency: Optional[float]):
+        with self._lock:
+            if latency is not None:
+                self._update(latency)
+            self.in_flight -= 1
+            self._wake()
+
+    def _wake(self):
+        while self._waiters and self._try_acquire():
+            loop, future = self._waiters.popleft()
+            # a slot handed to a waiter is counted immediately; it belongs to the waiter even if the wake is late
+            try:
+                loop.call_soon_threadsafe(_grant, future)
+            except RuntimeError:
+                # the waiter's loop is gone
+                self.in_flight -= 1
+                self.admitted -= 1
+
+    def _update(self, latency: float):
+        if self.long_rtt is None:
+            self.long_rtt = self.short_rtt = latency
+            return
+        self.short_rtt += (latency - self.short_rtt) * 0.1
+        self.long_rtt += (latency - self.long_rtt) * 0.002
+        if self.long_rtt > 2 * self.short_rtt:
+            # latency recovered; let the baseline follow it down faster
+            self.long_rtt *= 0.95
+        if self.in_flight < self.limit / 2:
+            # app-limited: low concurrency says nothing about how high the limit could go
+            return
+        gradient = max(0.5, min(1.0, ADMISSION_TOLERANCE * self.long_rtt / self.short_rtt))
+        target = self.limit * gradient + math.sqrt(self.limit)
+        self.limit = max(self.minimum, min(self.maximum, self.limit * 0.8 + target * 0.2))
+
+    def retry_after(self) -> int:
+        # roughly how long the current queue takes to drain at the current limit
+        rtt = self.short_rtt or 1.0
+        return max(1, math.ceil(rtt * (len(self._waiters) + 1) / max(1.0, self.limit)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            ms = lambda value: round(value * 1000, 2) if value is not None else None
+            return {
+                "limit": round(self.limit, 2),
+                "max_limit": self.maximum,
+                "in_flight": self.in_flight,
+                "queued": len(self._waiters),
+                "admitted": self.admitted,
+                "shed": self.shed,
+                "recent_latency_ms": ms(self.short_rtt),
+                "baseline_latency_ms": ms(self.long_rtt),
+            }
+
+def _grant(future: asyncio.Future):
+    if not future.done():
+        future.set_result(True)
+
+def _parse_limits(spec: str) -> Dict[str, GradientLimiter]:
+    limiters = {}
+    for part in spec.split(","):
+        if not part.strip():
+            continue
+        name, _, values = part.strip().partition(":")
+        initial, _, maximum = values.partition("/")
+        limiters[name] = GradientLimiter(name, int(initial), int(maximum or initial))
+    return limiters
+
+limiters = _parse_limits(ADMISSION_LIMITS)
+
+def stats() -> dict:
+    return {"enabled": ADMISSION_CONTROL, "classes": {name: limiter.stats() for name, limiter in limiters.items()}}
+
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not ADMISSION_CONTROL:
+            await self.app(scope, receive, send)
+            return
+        limiter = limiters.get(route_class(scope.get("method", ""), scope.get("path", "")))
+        if limiter is None:
+            await self.app(scope, receive, send)
+            return
+        if not await limiter.acquire(ADMISSION_QUEUE_TIMEOUT_MS / 1000):
+            await _shed(send, limiter)
+            return
+        start = time.perf_counter()
+        latency = None
+        try:
+            await self.app(scope, receive, send)
+            latency = time.perf_counter() - start
+        finally:
+            # failed requests release their slot without feeding the latency estimate
+            limiter.release(latency)
+
+async def _shed(send, limiter: GradientLimiter):
+    body = json.dumps({"detail": "Server is busy, retry shortly"}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": ADMISSION_SHED_STATUS,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            (b"retry-after", str(limiter.retry_after()).encode()),
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,51 @@
+import os
+from typing import FrozenSet
+
+from sqlalchemy import and_, exists, or_
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models
+from .cache import TTLCache
+from .database import is_primary
+
+load_dotenv()
+BLOCK_CACHE_SIZE = int(os.getenv("BLOCK_CACHE_SIZE", "10000"))
+BLOCK_CACHE_TTL_SECONDS = float(os.getenv("BLOCK_CACHE_TTL_SECONDS", "60"))
+
+# user_id -> ids of users blocked by or blocking user_id
+_cache = TTLCache(BLOCK_CACHE_SIZE, BLOCK_CACHE_TTL_SECONDS)
+
+def _load(db: Session, user_id: int) -> FrozenSet[int]:
+    rows = db.query(models.Block.blocker_id, models.Block.blocked_id).filter(
+        or_(models.Block.blocker_id == user_id, models.Block.blocked_id == user_id)
+    ).all()
+    return frozenset(blocked if blocker == user_id else blocker for blocker, blocked in rows)
+
+def get_block_set(db: Session, user_id: int) -> FrozenSet[int]:
+    ids = _cache.get(user_id)
+    if ids is None:
+        ids = _load(db, user_id)
+        if is_primary(db):
+            _cache.set(user_id, ids)
+    return ids
+
+def invalidate(*user_ids: int):
+    for user_id in user_ids:
+        _cache.pop(user_id)
+
+def clear():
+    _cache.clear()
+
+def stats() -> dict:
+    return _cache.stats()
+
+def is_blocked(db: Session, viewer_id: int, owner_id: int) -> bool:
+    return owner_id in get_block_set(db, viewer_id)
+
+# anti-join: excludes rows whose owner is blocked by, or is blocking, viewer_id
+def not_blocked_clause(viewer_id: int, owner_col):
+    return ~exists().where(or_(
+        and_(models.Block.blocker_id == viewer_id, models.Block.blocked_id == owner_col),
+        and_(models.Block.blocker_id == owner_col, models.Block.blocked_id == viewer_id),
+    ))
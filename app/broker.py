@@ -0,0 +1,128 @@
+import asyncio
+import enum
+import os
+import threading
+from bisect import bisect_right, insort
+from collections import deque
+from datetime import datetime
+from typing import Iterable, List, Optional
+
+from dotenv import load_dotenv
+
+load_dotenv()
+# events buffered per subscriber before it is treated as a slow consumer and disconnected
+STREAM_SUBSCRIBER_BUFFER = int(os.getenv("STREAM_SUBSCRIBER_BUFFER", "256"))
+# recent events kept in memory for Last-Event-ID replay; older gaps are replayed from the database
+STREAM_REPLAY_SIZE = int(os.getenv("STREAM_REPLAY_SIZE", "1000"))
+
+ACTIVITY_FIELDS = ("id", "actor_id", "verb", "target_user_id", "target_post_id", "created_at", "extra")
+
+def activity_event(row) -> dict:
+    event = {}
+    for field in ACTIVITY_FIELDS:
+        value = row[field] if isinstance(row, dict) else getattr(row, field)
+        if isinstance(value, enum.Enum):
+            value = value.value
+        elif isinstance(value, datetime):
+            value = value.isoformat()
+        event[field] = value
+    return event
+
+class Subscription:
+    def __init__(self, loop: asyncio.AbstractEventLoop, maxsize: int):
+        self.loop = loop
+        self.queue: "asyncio.Queue[dict]" = asyncio.Queue(maxsize=maxsize)
+        self.dropped = False
+
+    def _offer(self, event: dict):
+        if self.dropped:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # slow consumer: cut it off; the client reconnects with Last-Event-ID and replays
+            self.dropped = True
+            self.queue = asyncio.Queue(maxsize=1)
+            self.queue.put_nowait(None)
+
+    async def get(self, timeout: float) -> Optional[dict]:
+        return await asyncio.wait_for(self.queue.get(), timeout)
+
+class Broker:
+    def __init__(self, buffer_size: int = STREAM_SUBSCRIBER_BUFFER, replay_size: int = STREAM_REPLAY_SIZE):
+        self.buffer_size = buffer_size
+        self._subscribers: List[Subscription] = []
+        self.replay_size = replay_size
+        # kept sorted by id: sessions commit concurrently, so a lower id can be published after a higher one
+        self._recent: List[dict] = []
+        self._lock = threading.Lock()
+        self.published = 0
+        self.dropped = 0
+
+    def subscribe(self) -> Subscription:
+        sub = Subscription(asyncio.get_running_loop(), self.buffer_size)
+        with self._lock:
+            self._subscribers.append(sub)
+        return sub
+
+    def unsubscribe(self, sub: Subscription):
+        with self._lock:
+            if sub in self._subscribers:
+                self._subscribers.remove(sub)
+            if sub.dropped:
+                self.dropped += 1
+
+    def publish(self, events: Iterable[dict]):
+        # may be called from any thread; delivery happens on each subscriber's event loop
+        events = sorted(events, key=lambda e: e["id"])
+        if not events:
+            return
+        with self._lock:
+            for event in events:
+                if not self._recent or event["id"] > self._recent[-1]["id"]:
+                    self._recent.append(event)
+                else:
+                    insort(self._recent, event, key=lambda e: e["id"])
+            if len(self._recent) > self.replay_size:
+                del self._recent[:len(self._recent) - self.replay_size]
+            self.published += len(events)
+            subscribers = list(self._subscribers)
+        for sub in subscribers:
+            for event in events:
+                try:
+                    sub.loop.call_soon_threadsafe(sub._offer, event)
+                except RuntimeError:
+                    # loop already closed
+                    break
+
+    def replay(self, after_id: int) -> Optional[List[dict]]:
+        # events newer than after_id, or None when the buffer no longer reaches back that far
+        with self._lock:
+            if not self._recent or self._recent[0]["id"] > after_id + 1:
+                return None
+            start = bisect_right(self._recent, after_id, key=lambda e: e["id"])
+            return self._recent[start:]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"subscribers": len(self._subscribers), "published": self.published, "dropped": self.dropped, "buffered": len(self._recent)}
+
+class SeenIds:
+    # the last `size` event ids a stream has sent, for dropping duplicates without assuming ids arrive in order
+    def __init__(self, size: int = STREAM_REPLAY_SIZE):
+        self._order: deque = deque()
+        self._ids: set = set()
+        self.size = size
+
+    def __contains__(self, event_id: int) -> bool:
+        return event_id in self._ids
+
+    def add(self, event_id: int):
+        if event_id in self._ids:
+            return
+        self._order.append(event_id)
+        self._ids.add(event_id)
+        if len(self._order) > self.size:
+            self._ids.discard(self._order.popleft())
+
+broker = Broker()
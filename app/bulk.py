@@ -0,0 +1,33 @@
+import os
+from datetime import datetime
+from typing import Iterable, List
+
+from sqlalchemy import select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+load_dotenv()
+# most targets accepted by one batch request
+BULK_MAX_ITEMS = int(os.getenv("BULK_MAX_ITEMS", "100"))
+
+def insert_edges(db: Session, model, source_key: str, source_id: int, target_key: str, target_ids: Iterable[int]) -> List[int]:
+    # insert (source, target) edges that don't exist yet; returns the targets that were actually inserted
+    target_ids = list(target_ids)
+    if not target_ids:
+        return []
+    table = model.__table__
+    now = datetime.utcnow()
+    rows = [{source_key: source_id, target_key: target_id, "created_at": now} for target_id in target_ids]
+    if db.get_bind().dialect.name == "postgresql":
+        stmt = postgresql.insert(table).values(rows).on_conflict_do_nothing().returning(table.c[target_key])
+        return db.execute(stmt).scalars().all()
+    # SQLite: no RETURNING on this SQLAlchemy version, so insert-or-ignore in one statement and read back the edges
+    # stamped with this batch's created_at; rows that already existed, or that a concurrent writer got in first,
+    # carry a different timestamp
+    db.execute(sqlite.insert(table).values(rows).on_conflict_do_nothing())
+    return db.execute(
+        select(table.c[target_key]).where(
+            table.c[source_key] == source_id, table.c[target_key].in_(target_ids), table.c.created_at == now
+        )
+    ).scalars().all()
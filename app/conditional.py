@@ -0,0 +1,67 @@
+import hashlib
+import os
+from typing import Callable, Optional, Tuple
+
+from fastapi import Request
+from fastapi.responses import Response
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models, blocklist, pagination
+from .cache import TTLCache
+
+load_dotenv()
+# rendered pages shared between viewers whose ETag (watermark + page + block state) is identical; 0 disables
+RESPONSE_CACHE_SIZE = int(os.getenv("RESPONSE_CACHE_SIZE", "512"))
+RESPONSE_CACHE_TTL_SECONDS = float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "30"))
+
+_pages = TTLCache(max(RESPONSE_CACHE_SIZE, 1), RESPONSE_CACHE_TTL_SECONDS)
+
+def activities_watermark(db: Session) -> Tuple:
+    # newest (created_at, id), answered from ix_activities_created_id without touching the rows
+    return tuple(db.execute(
+        select(models.Activity.created_at, models.Activity.id)
+        .order_by(models.Activity.created_at.desc(), models.Activity.id.desc()).limit(1)
+    ).first() or ())
+
+def posts_watermark(db: Session) -> Tuple:
+    # updated_at moves on create, delete and like-count changes; a deletion job's updated_at moves when it starts and
+    # after every chunk of posts and likes it hard-deletes; the activity watermark covers the rest
+    return tuple(db.execute(select(
+        select(func.max(models.Post.updated_at)).scalar_subquery(),
+        select(func.max(models.UserDeletionJob.updated_at)).scalar_subquery(),
+    )).one()) + activities_watermark(db)
+
+def block_state(db: Session, viewer_id: int) -> str:
+    ids = blocklist.get_block_set(db, viewer_id)
+    if not ids:
+        return ""
+    return hashlib.sha1(",".join(map(str, sorted(ids))).encode()).hexdigest()
+
+def make_etag(*parts) -> str:
+    return '"' + hashlib.sha1(repr(parts).encode()).hexdigest() + '"'
+
+def _matches(request: Request, etag: str) -> bool:
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    candidates = [value.strip() for value in header.split(",")]
+    return "*" in candidates or any(c.removeprefix("W/") == etag for c in candidates)
+
+def page_response(request: Request, etag: str, render: Callable[[], Tuple[bytes, Optional[str]]]) -> Response:
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if _matches(request, etag):
+        return Response(status_code=304, headers=headers)
+    page = _pages.get(etag) if RESPONSE_CACHE_SIZE else None
+    if page is None:
+        page = render()
+        if RESPONSE_CACHE_SIZE:
+            _pages.set(etag, page)
+    body, next_cursor = page
+    if next_cursor:
+        headers[pagination.NEXT_CURSOR_HEADER] = next_cursor
+    return Response(content=body, media_type="application/json", headers=headers)
+
+def stats() -> dict:
+    return _pages.stats()
@@ -0,0 +1,84 @@
+import argparse
+from typing import List, Optional
+
+from sqlalchemy import func, select, update
+from sqlalchemy.orm import Session
+
+from . import models
+
+# all updates are single "SET col = col + n" statements so concurrent writers never lose increments
+
+def _bump(db: Session, column, row_id: int, delta: int):
+    table = column.class_
+    db.execute(
+        update(table).where(table.id == row_id).values({column.key: column + delta})
+        .execution_options(synchronize_session=False)
+    )
+
+def bump_many(db: Session, column, row_ids, delta: int):
+    if not row_ids:
+        return
+    table = column.class_
+    db.execute(
+        update(table).where(table.id.in_(row_ids)).values({column.key: column + delta})
+        .execution_options(synchronize_session=False)
+    )
+
+def on_like(db: Session, post_id: int, delta: int = 1):
+    _bump(db, models.Post.like_count, post_id, delta)
+
+def on_follow(db: Session, follower_id: int, followed_id: int, delta: int = 1):
+    _bump(db, models.User.following_count, follower_id, delta)
+    _bump(db, models.User.follower_count, followed_id, delta)
+
+def on_follow_many(db: Session, follower_id: int, followed_ids, delta: int = 1):
+    if not followed_ids:
+        return
+    _bump(db, models.User.following_count, follower_id, delta * len(followed_ids))
+    bump_many(db, models.User.follower_count, followed_ids, delta)
+
+def _recount(db: Session, column, counted) -> int:
+    table = column.class_
+    actual = func.coalesce(counted.scalar_subquery(), 0)
+    result = db.execute(
+        update(table).where(column != actual).values({column.key: actual})
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount
+
+def recount(db: Session) -> dict:
+    # also runs on a bare Connection, from the migration that adds the columns
+    return {
+        "posts.like_count": _recount(
+            db, models.Post.like_count,
+            select(func.count(models.Like.id)).where(models.Like.post_id == models.Post.id),
+        ),
+        "users.follower_count": _recount(
+            db, models.User.follower_count,
+            select(func.count(models.Follow.id)).where(models.Follow.followed_id == models.User.id),
+        ),
+        "users.following_count": _recount(
+            db, models.User.following_count,
+            select(func.count(models.Follow.id)).where(models.Follow.follower_id == models.User.id),
+        ),
+    }
+
+def reconcile(db: Session) -> dict:
+    repaired = recount(db)
+    db.commit()
+    return repaired
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Recompute denormalized like/follower counters")
+    parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        for column, count in reconcile(db).items():
+            print(f"{column}: {count} rows repaired")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
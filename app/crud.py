@@ -1,6 +1,9 @@
+from datetime import datetime
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from . import models, utils
-from typing import Optional
+from .database import note_write
+from . import models, utils, blocklist, timeline, pagination, activity_writer, principal_cache, counters, bulk, trending, follow_graph, search
+from typing import Dict, List, Optional
 
 def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.username == username).first()
@@ -8,6 +11,11 @@ def get_user_by_username(db: Session, username: str) -> Optional[models.User]:
 def get_user_by_email(db: Session, email: str) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.email == email).first()
 
+def get_usernames(db: Session, user_ids) -> Dict[int, str]:
+    if not user_ids:
+        return {}
+    return dict(db.query(models.User.id, models.User.username).filter(models.User.id.in_(user_ids)).all())
+
 def get_user(db: Session, user_id: int) -> Optional[models.User]:
     return db.query(models.User).filter(models.User.id == user_id).first()
 
@@ -17,19 +25,31 @@ def create_user(db: Session, username: str, email: str, password: str, role: mod
     db.add(user)
     db.commit()
     db.refresh(user)
+    # no principal on the session yet: open the read-your-writes window so the first authenticated read finds the user
+    note_write(user.id)
     return user
 
-def delete_user(db: Session, user: models.User):
-    db.delete(user)
+def update_password_hash(db: Session, user: models.User, hashed_password: str):
+    user.hashed_password = hashed_password
+    db.add(user)
+    db.commit()
+    note_write(user.id)
+    principal_cache.invalidate(user.id)
+
+def set_role(db: Session, user: models.User, role: models.RoleEnum):
+    user.role = role
+    db.add(user)
     db.commit()
+    principal_cache.invalidate(user.id)
 
 def create_post(db: Session, owner: models.User, content: str) -> models.Post:
     post = models.Post(content=content, owner=owner)
     db.add(post)
+    db.flush()
+    timeline.fan_out(db, post)
+    search.on_post_created(db, post)
+    activity_writer.record(db, models.ActivityType.post, actor_id=owner.id, target_post_id=post.id)
     db.commit()
-    db.refresh(post)
-    activity = models.Activity(actor_id=owner.id, verb=models.ActivityType.post, target_post_id=post.id)
-    db.add(activity); db.commit()
     return post
 
 def get_post(db: Session, post_id: int) -> Optional[models.Post]:
@@ -38,88 +58,165 @@ def get_post(db: Session, post_id: int) -> Optional[models.Post]:
 def delete_post(db: Session, post: models.Post, actor_id: Optional[int] = None):
     post.deleted = True
     db.add(post)
-    activity = models.Activity(actor_id=actor_id, verb=models.ActivityType.delete_post, target_post_id=post.id)
-    db.add(activity)
+    timeline.on_post_deleted(db, post.id)
+    trending.on_post_deleted(db, post.id)
+    search.on_post_deleted(db, post.id)
+    activity_writer.record(db, models.ActivityType.delete_post, actor_id=actor_id, target_post_id=post.id)
     db.commit()
 
 def like_post(db: Session, user: models.User, post: models.Post):
-    from sqlalchemy.exc import IntegrityError
     like = models.Like(user=user, post=post)
     db.add(like)
     try:
-        db.commit()
+        db.flush()
     except IntegrityError:
         db.rollback()
         return None
-    db.refresh(like)
-    activity = models.Activity(actor_id=user.id, verb=models.ActivityType.like, target_post_id=post.id)
-    db.add(activity); db.commit()
+    counters.on_like(db, post.id)
+    trending.on_like(db, post.id, like.created_at)
+    activity_writer.record(db, models.ActivityType.like, actor_id=user.id, target_post_id=post.id)
+    db.commit()
     return like
 
+def like_posts(db: Session, user: models.User, post_ids: List[int]) -> Dict[int, str]:
+    # per-post outcome: liked, already_liked, not_found or blocked; all new likes land in one transaction
+    posts = dict(db.query(models.Post.id, models.Post.owner_id).filter(
+        models.Post.id.in_(post_ids), models.Post.deleted == False
+    ).all())
+    blocked = blocklist.get_block_set(db, user.id)
+    results = {}
+    for post_id in post_ids:
+        if post_id not in posts:
+            results[post_id] = "not_found"
+        elif posts[post_id] in blocked:
+            results[post_id] = "blocked"
+    wanted = [post_id for post_id in post_ids if post_id not in results]
+    liked = bulk.insert_edges(db, models.Like, "user_id", user.id, "post_id", wanted)
+    counters.bump_many(db, models.Post.like_count, liked, 1)
+    liked_at = datetime.utcnow()
+    for post_id in liked:
+        trending.on_like(db, post_id, liked_at)
+        activity_writer.record(db, models.ActivityType.like, actor_id=user.id, target_post_id=post_id)
+    db.commit()
+    liked = set(liked)
+    for post_id in wanted:
+        results[post_id] = "liked" if post_id in liked else "already_liked"
+    return results
+
 def unlike_post(db: Session, user: models.User, post: models.Post):
     like = db.query(models.Like).filter(models.Like.user_id==user.id, models.Like.post_id==post.id).first()
     if like:
         db.delete(like)
+        counters.on_like(db, post.id, -1)
+        trending.on_like(db, post.id, like.created_at, -1)
         db.commit()
 
 def follow_user(db: Session, follower: models.User, followed: models.User):
-    from sqlalchemy.exc import IntegrityError
     follow = models.Follow(follower=follower, followed=followed)
     db.add(follow)
     try:
-        db.commit()
+        db.flush()
     except IntegrityError:
         db.rollback()
         return None
-    db.refresh(follow)
-    activity = models.Activity(actor_id=follower.id, verb=models.ActivityType.follow, target_user_id=followed.id)
-    db.add(activity); db.commit()
+    counters.on_follow(db, follower.id, followed.id)
+    timeline.on_follow(db, follower.id, followed.id)
+    follow_graph.on_follow(db, follower.id, followed.id)
+    activity_writer.record(db, models.ActivityType.follow, actor_id=follower.id, target_user_id=followed.id)
+    db.commit()
+    principal_cache.invalidate(follower.id, followed.id)
     return follow
 
+def follow_users(db: Session, follower: models.User, usernames: List[str]) -> Dict[str, str]:
+    # per-username outcome: followed, already_following, not_found, self or blocked; one transaction for the batch
+    users = dict(db.query(models.User.username, models.User.id).filter(models.User.username.in_(usernames)).all())
+    blocked = blocklist.get_block_set(db, follower.id)
+    results = {}
+    for username in usernames:
+        if username not in users:
+            results[username] = "not_found"
+        elif users[username] == follower.id:
+            results[username] = "self"
+        elif users[username] in blocked:
+            results[username] = "blocked"
+    wanted = [users[username] for username in usernames if username not in results]
+    followed = bulk.insert_edges(db, models.Follow, "follower_id", follower.id, "followed_id", wanted)
+    counters.on_follow_many(db, follower.id, followed)
+    for followed_id in followed:
+        timeline.on_follow(db, follower.id, followed_id)
+        follow_graph.on_follow(db, follower.id, followed_id)
+        activity_writer.record(db, models.ActivityType.follow, actor_id=follower.id, target_user_id=followed_id)
+    db.commit()
+    principal_cache.invalidate(follower.id, *followed)
+    followed = set(followed)
+    for username in usernames:
+        if username not in results:
+            results[username] = "followed" if users[username] in followed else "already_following"
+    return results
+
 def unfollow_user(db: Session, follower: models.User, followed: models.User):
     f = db.query(models.Follow).filter(models.Follow.follower_id==follower.id, models.Follow.followed_id==followed.id).first()
     if f:
         db.delete(f)
+        counters.on_follow(db, follower.id, followed.id, -1)
+        timeline.on_unfollow(db, follower.id, followed.id)
+        follow_graph.on_unfollow(db, follower.id, followed.id)
         db.commit()
+        principal_cache.invalidate(follower.id, followed.id)
 
 def block_user(db: Session, blocker: models.User, blocked: models.User):
-    from sqlalchemy.exc import IntegrityError
     b = models.Block(blocker=blocker, blocked=blocked)
     db.add(b)
     try:
-        db.commit()
+        db.flush()
     except IntegrityError:
         db.rollback()
         return None
-    db.refresh(b)
-    activity = models.Activity(actor_id=blocker.id, verb=models.ActivityType.block, target_user_id=blocked.id)
-    db.add(activity); db.commit()
+    timeline.on_block(db, blocker.id, blocked.id)
+    follow_graph.on_block(db, blocker.id, blocked.id)
+    activity_writer.record(db, models.ActivityType.block, actor_id=blocker.id, target_user_id=blocked.id)
+    db.commit()
+    blocklist.invalidate(blocker.id, blocked.id)
     return b
 
 def unblock_user(db: Session, blocker: models.User, blocked: models.User):
     b = db.query(models.Block).filter(models.Block.blocker_id==blocker.id, models.Block.blocked_id==blocked.id).first()
     if b:
         db.delete(b)
+        follow_graph.on_unblock(db, blocker.id, blocked.id)
         db.commit()
+        blocklist.invalidate(blocker.id, blocked.id)
+
+def get_global_activity(db: Session, limit: int = 50, before: Optional[pagination.Cursor] = None, columns: Optional[list] = None):
+    q = db.query(*columns) if columns else db.query(models.Activity)
+    if before:
+        q = q.filter(pagination.before_clause(models.Activity.created_at, models.Activity.id, before))
+    return q.order_by(models.Activity.created_at.desc(), models.Activity.id.desc()).limit(limit).all()
 
-def get_global_activity(db: Session, limit: int = 50):
-    return db.query(models.Activity).order_by(models.Activity.created_at.desc()).limit(limit).all()
+def get_activities_after(db: Session, after_id: int, limit: int):
+    return db.query(models.Activity).filter(models.Activity.id > after_id).order_by(models.Activity.id).limit(limit).all()
 
 def is_blocked(db: Session, viewer_id: int, owner_id: int) -> bool:
-    blocked = db.query(models.Block).filter(
-        (models.Block.blocker_id == viewer_id) & (models.Block.blocked_id == owner_id)
-    ).first()
-    blocked2 = db.query(models.Block).filter(
-        (models.Block.blocker_id == owner_id) & (models.Block.blocked_id == viewer_id)
-    ).first()
-    return bool(blocked or blocked2)
-
-def get_posts_for_user(db: Session, viewer: Optional[models.User], limit: int = 50):
-    q = db.query(models.Post).filter(models.Post.deleted == False).order_by(models.Post.created_at.desc()).limit(limit)
-    posts = []
-    for post in q:
-        if viewer:
-            if is_blocked(db, viewer.id, post.owner_id):
-                continue
-        posts.append(post)
-    return posts
+    return blocklist.is_blocked(db, viewer_id, owner_id)
+
+def get_posts_for_user(db: Session, viewer: Optional[models.User], limit: int = 50, before: Optional[pagination.Cursor] = None, columns: Optional[list] = None):
+    q = db.query(*columns) if columns else db.query(models.Post)
+    q = q.filter(models.Post.deleted == False)
+    if before:
+        q = q.filter(pagination.before_clause(models.Post.created_at, models.Post.id, before))
+    if viewer:
+        q = q.filter(blocklist.not_blocked_clause(viewer.id, models.Post.owner_id))
+    return q.order_by(models.Post.created_at.desc(), models.Post.id.desc()).limit(limit).all()
+
+def get_posts_by_ids(db: Session, viewer: models.User, post_ids: List[int]) -> List[models.Post]:
+    # visible posts among post_ids, in the given order
+    if not post_ids:
+        return []
+    posts = db.query(models.Post).filter(
+        models.Post.id.in_(post_ids), models.Post.deleted == False, blocklist.not_blocked_clause(viewer.id, models.Post.owner_id)
+    ).all()
+    by_id = {post.id: post for post in posts}
+    return [by_id[post_id] for post_id in post_ids if post_id in by_id]
+
+def get_home_timeline(db: Session, viewer: models.User, limit: int = 50):
+    return timeline.read_home_timeline(db, viewer, limit=limit)
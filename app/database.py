@@ -1,20 +1,108 @@
+import itertools
 import os
-from sqlalchemy import create_engine
+import threading
+import time
+from typing import Optional
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
 from sqlalchemy.orm import sessionmaker, declarative_base
 from dotenv import load_dotenv
 
+from .cache import TTLCache
+from .instrumentation import instrument_engine
+
 load_dotenv()
 
 DATABASE_URL = os.getenv("DATABASE_URL")
 if not DATABASE_URL:
     raise RuntimeError("Please set DATABASE_URL in environment")
 
-engine = create_engine(DATABASE_URL, echo=False, future=True)
+# comma-separated read replicas; reads fall back to the primary when none are configured or healthy
+DATABASE_REPLICA_URLS = [url.strip() for url in os.getenv("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+DB_POOL_SIZE = os.getenv("DB_POOL_SIZE")
+DB_MAX_OVERFLOW = os.getenv("DB_MAX_OVERFLOW")
+DB_POOL_TIMEOUT = os.getenv("DB_POOL_TIMEOUT")
+DB_POOL_RECYCLE = os.getenv("DB_POOL_RECYCLE")
+DB_POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "true").lower() in ("1", "true", "yes")
+# how long a failed replica is skipped before it is tried again
+REPLICA_RETRY_SECONDS = float(os.getenv("REPLICA_RETRY_SECONDS", "30"))
+# after a user's own write, their reads go to the primary for this long so they see it despite replica lag
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+def _engine_options(url: str) -> dict:
+    options = {"echo": False, "future": True, "pool_pre_ping": DB_POOL_PRE_PING}
+    if DB_POOL_RECYCLE:
+        options["pool_recycle"] = int(DB_POOL_RECYCLE)
+    # SQLite uses NullPool/SingletonThreadPool, which take no size or timeout arguments
+    if make_url(url).get_backend_name() != "sqlite":
+        if DB_POOL_SIZE:
+            options["pool_size"] = int(DB_POOL_SIZE)
+        if DB_MAX_OVERFLOW:
+            options["max_overflow"] = int(DB_MAX_OVERFLOW)
+        if DB_POOL_TIMEOUT:
+            options["pool_timeout"] = float(DB_POOL_TIMEOUT)
+    return options
+
+engine = create_engine(DATABASE_URL, **_engine_options(DATABASE_URL))
+instrument_engine(engine)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False)
 
 Base = declarative_base()
 
-def init_db():
-    # import models to ensure they're registered on Base.metadata
-    import app.models  # noqa: F401
-    Base.metadata.create_all(bind=engine)
+class _Replica:
+    def __init__(self, url: str):
+        self.engine = create_engine(url, **_engine_options(url))
+        self.down_until = 0.0
+        instrument_engine(self.engine)
+        event.listen(self.engine, "handle_error", self._on_error)
+
+    def _on_error(self, context):
+        if context.is_disconnect or context.connection is None:
+            self.down_until = time.monotonic() + REPLICA_RETRY_SECONDS
+
+    @property
+    def healthy(self) -> bool:
+        return time.monotonic() >= self.down_until
+
+replicas = [_Replica(url) for url in DATABASE_REPLICA_URLS]
+_replica_cycle = itertools.cycle(range(len(replicas))) if replicas else None
+_replica_lock = threading.Lock()
+_recent_writers = TTLCache(100000, READ_YOUR_WRITES_SECONDS)
+
+def note_write(user_id: int):
+    _recent_writers.set(user_id, True)
+
+def read_engine(user_id: Optional[int] = None):
+    if not replicas or (user_id is not None and _recent_writers.get(user_id)):
+        return engine
+    with _replica_lock:
+        for _ in range(len(replicas)):
+            replica = replicas[next(_replica_cycle)]
+            if replica.healthy:
+                return replica.engine
+    return engine
+
+def is_primary(db) -> bool:
+    # process-wide caches are only filled from the primary: a lagging replica could put a stale role or block set
+    # back into them, and the write paths would then trust it for the whole TTL
+    return db.get_bind() is engine
+
+@event.listens_for(SessionLocal, "after_flush")
+def _mark_write(session, flush_context):
+    session.info["wrote"] = True
+
+@event.listens_for(SessionLocal, "do_orm_execute")
+def _mark_dml(orm_execute_state):
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        orm_execute_state.session.info["wrote"] = True
+
+@event.listens_for(SessionLocal, "after_commit")
+def _remember_writer(session):
+    principal_id = session.info.get("principal_id")
+    if session.info.pop("wrote", False) and principal_id is not None:
+        note_write(principal_id)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _forget_write(session):
+    session.info.pop("wrote", None)
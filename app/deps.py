@@ -1,9 +1,11 @@
+from typing import Optional
+
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from sqlalchemy.orm import Session
 
-from .database import SessionLocal
-from . import crud, auth, models
+from .database import SessionLocal, ReadSessionLocal, read_engine
+from . import auth, models, principal_cache
 
 # Simple Bearer Token (NOT OAuth2)
 security = HTTPBearer()
@@ -15,23 +17,31 @@ def get_db():
     finally:
         db.close()
 
-def get_current_user(
-    credentials: HTTPAuthorizationCredentials = Depends(security),
-    db: Session = Depends(get_db),
-):
-    # Extract token
-    token = credentials.credentials
-
-    # Decode JWT
+def _token_user_id(token: str) -> Optional[int]:
     payload = auth.decode_token(token)
     if not payload or "user_id" not in payload:
+        return None
+    return payload["user_id"]
+
+def get_read_db(credentials: HTTPAuthorizationCredentials = Depends(security)):
+    # read-only session on a replica, or on the primary while the caller is inside their read-your-writes window
+    db = ReadSessionLocal(bind=read_engine(_token_user_id(credentials.credentials)))
+    try:
+        yield db
+    finally:
+        db.close()
+
+def _authenticate(token: str, db: Session) -> models.User:
+    # Decode JWT
+    user_id = _token_user_id(token)
+    if user_id is None:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired token",
         )
 
-    user = crud.get_user(db, payload["user_id"])
-    if not user:
+    user = principal_cache.get_principal(db, user_id, token)
+    if not user or user.deleting:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="User not found"
@@ -39,6 +49,21 @@ def get_current_user(
 
     return user
 
+def get_current_user(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_db),
+):
+    user = _authenticate(credentials.credentials, db)
+    # lets the session remember who wrote, for read-your-writes routing
+    db.info["principal_id"] = user.id
+    return user
+
+def get_current_reader(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    db: Session = Depends(get_read_db),
+):
+    return _authenticate(credentials.credentials, db)
+
 def require_role(role: models.RoleEnum):
     def _require_role(current_user: models.User = Depends(get_current_user)):
         if current_user.role != role and current_user.role != models.RoleEnum.owner:
@@ -0,0 +1,65 @@
+import csv
+import enum
+import io
+import json
+import os
+from datetime import datetime
+from typing import Iterator, Optional
+
+from sqlalchemy import select
+from dotenv import load_dotenv
+
+from . import models
+from .database import engine
+
+load_dotenv()
+EXPORT_CHUNK_SIZE = int(os.getenv("EXPORT_CHUNK_SIZE", "1000"))
+
+EXPORT_FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+EXPORTABLE = {
+    "activities": models.Activity.__table__,
+    "posts": models.Post.__table__,
+}
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def _encode_ndjson(columns, rows) -> str:
+    return "".join(json.dumps(dict(zip(columns, map(_plain, row))), separators=(",", ":")) + "\n" for row in rows)
+
+def _encode_csv(columns, rows) -> str:
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    writer.writerows([map(_plain, row) for row in rows])
+    return buf.getvalue()
+
+def stream_table(
+    name: str,
+    fmt: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    chunk_size: int = EXPORT_CHUNK_SIZE,
+) -> Iterator[str]:
+    # rows are emitted in id order, so the last id seen is a resume point for after_id
+    table = EXPORTABLE[name]
+    columns = [c.key for c in table.columns]
+    stmt = select(*table.columns).order_by(table.c.id)
+    if since:
+        stmt = stmt.where(table.c.created_at >= since)
+    if until:
+        stmt = stmt.where(table.c.created_at < until)
+    if after_id is not None:
+        stmt = stmt.where(table.c.id > after_id)
+    encode = _encode_csv if fmt == "csv" else _encode_ndjson
+    if fmt == "csv":
+        yield _encode_csv(columns, [columns])
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=chunk_size).execute(stmt)
+        for rows in result.partitions(chunk_size):
+            yield encode(columns, rows)
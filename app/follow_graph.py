@@ -0,0 +1,218 @@
+import logging
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import and_, event, exists, or_, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models
+from .background import PeriodicTask
+from .database import SessionLocal
+
+load_dotenv()
+# how often each worker reloads the graph from the follows table (folds in other workers' writes, compacts deltas)
+GRAPH_REFRESH_SECONDS = float(os.getenv("GRAPH_REFRESH_SECONDS", "600"))
+# suggestion work caps, so a viewer following celebrities does not walk millions of edges
+GRAPH_SUGGEST_MAX_FRIENDS = int(os.getenv("GRAPH_SUGGEST_MAX_FRIENDS", "500"))
+GRAPH_SUGGEST_MAX_PER_FRIEND = int(os.getenv("GRAPH_SUGGEST_MAX_PER_FRIEND", "1000"))
+
+logger = logging.getLogger(__name__)
+
+_EVENTS_KEY = "follow_graph_events"
+
+class FollowGraph:
+    # out-edges in CSR form: the accounts user u follows are targets[offsets[u]:offsets[u + 1]], sorted, 4 bytes each;
+    # writes since the last load live in small per-user add/remove sets until the next reload folds them in
+    def __init__(self):
+        self.offsets = array("q", [0])
+        self.targets = array("i")
+        self._added: Dict[int, Set[int]] = {}
+        self._removed: Dict[int, Set[int]] = {}
+        self._replay: Optional[list] = None
+        self._lock = threading.RLock()
+        self.loaded = False
+
+    def _bounds(self, user_id: int) -> Tuple[int, int]:
+        if user_id + 1 >= len(self.offsets):
+            return 0, 0
+        return self.offsets[user_id], self.offsets[user_id + 1]
+
+    def _in_base(self, follower_id: int, followed_id: int) -> bool:
+        lo, hi = self._bounds(follower_id)
+        i = bisect_left(self.targets, followed_id, lo, hi)
+        return i < hi and self.targets[i] == followed_id
+
+    def follows(self, follower_id: int, followed_id: int) -> bool:
+        with self._lock:
+            if followed_id in self._added.get(follower_id, ()):
+                return True
+            return followed_id not in self._removed.get(follower_id, ()) and self._in_base(follower_id, followed_id)
+
+    def following(self, user_id: int, limit: Optional[int] = None) -> List[int]:
+        with self._lock:
+            lo, hi = self._bounds(user_id)
+            removed = self._removed.get(user_id, ())
+            ids = [t for t in self.targets[lo:hi if limit is None else min(hi, lo + limit)] if t not in removed]
+            ids.extend(self._added.get(user_id, ()))
+            return ids
+
+    def _add(self, follower_id: int, followed_id: int):
+        removed = self._removed.get(follower_id)
+        if removed and followed_id in removed:
+            removed.discard(followed_id)
+        elif not self._in_base(follower_id, followed_id):
+            self._added.setdefault(follower_id, set()).add(followed_id)
+
+    def _remove(self, follower_id: int, followed_id: int):
+        added = self._added.get(follower_id)
+        if added and followed_id in added:
+            added.discard(followed_id)
+        elif self._in_base(follower_id, followed_id):
+            self._removed.setdefault(follower_id, set()).add(followed_id)
+
+    def _remove_user(self, user_id: int):
+        self._added.pop(user_id, None)
+        lo, hi = self._bounds(user_id)
+        if hi > lo:
+            self._removed[user_id] = set(self.targets[lo:hi])
+        for added in self._added.values():
+            added.discard(user_id)
+        # in-edges are not indexed; edges pointing at the deleted user stay until the next reload, and callers
+        # resolve ids against the users table, which no longer has it
+
+    def apply(self, events: List[tuple]):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(events)
+            self._apply(events)
+
+    def _apply(self, events: List[tuple]):
+        # every event is idempotent, so replaying one the reload already saw is harmless
+        for kind, a, b in events:
+            if kind == "follow":
+                self._add(a, b)
+            elif kind == "unfollow" or kind == "block":
+                self._remove(a, b)
+                if kind == "block":
+                    self._remove(b, a)
+            elif kind == "unblock":
+                # b is the list of edges between the pair that exist in the follows table
+                for follower_id, followed_id in b:
+                    self._add(follower_id, followed_id)
+            elif kind == "user_deleted":
+                self._remove_user(a)
+
+    def load(self, db: Session):
+        # follows between users who block each other are left out, matching what block_user removes
+        blocked = exists().where(or_(
+            and_(models.Block.blocker_id == models.Follow.follower_id, models.Block.blocked_id == models.Follow.followed_id),
+            and_(models.Block.blocker_id == models.Follow.followed_id, models.Block.blocked_id == models.Follow.follower_id),
+        ))
+        with self._lock:
+            self._replay = []
+        offsets = array("q", [0])
+        targets = array("i")
+        try:
+            rows = db.execute(
+                select(models.Follow.follower_id, models.Follow.followed_id).where(~blocked)
+                .order_by(models.Follow.follower_id, models.Follow.followed_id)
+                .execution_options(yield_per=50000)
+            )
+            for follower_id, followed_id in rows:
+                while len(offsets) <= follower_id:
+                    offsets.append(len(targets))
+                targets.append(followed_id)
+            offsets.append(len(targets))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self.offsets, self.targets = offsets, targets
+            self._added, self._removed = {}, {}
+            self._apply(replay)
+            self.loaded = True
+
+    def suggestions(self, user_id: int, exclude: Set[int], limit: int) -> List[Tuple[int, int]]:
+        # friends of friends ranked by how many of the user's follows follow them: [(user_id, mutual_count)]
+        friends = self.following(user_id)
+        skip = set(friends) | exclude | {user_id}
+        counts: Counter = Counter()
+        for friend in friends[:GRAPH_SUGGEST_MAX_FRIENDS]:
+            counts.update(t for t in self.following(friend, GRAPH_SUGGEST_MAX_PER_FRIEND) if t not in skip)
+        return sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:limit]
+
+    def followed_by_friends(self, viewer_id: int, user_id: int) -> List[int]:
+        # which of the accounts viewer follows also follow user_id; one binary search per account
+        return [friend for friend in self.following(viewer_id) if friend != user_id and self.follows(friend, user_id)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "loaded": self.loaded,
+                "edges": len(self.targets),
+                "nodes": len(self.offsets) - 1,
+                "bytes": len(self.offsets) * self.offsets.itemsize + len(self.targets) * self.targets.itemsize,
+                "pending_adds": sum(len(s) for s in self._added.values()),
+                "pending_removes": sum(len(s) for s in self._removed.values()),
+            }
+
+graph = FollowGraph()
+
+def _queue(db: Session, *event_):
+    db.info.setdefault(_EVENTS_KEY, []).append(event_)
+
+def on_follow(db: Session, follower_id: int, followed_id: int):
+    _queue(db, "follow", follower_id, followed_id)
+
+def on_unfollow(db: Session, follower_id: int, followed_id: int):
+    _queue(db, "unfollow", follower_id, followed_id)
+
+def on_block(db: Session, blocker_id: int, blocked_id: int):
+    _queue(db, "block", blocker_id, blocked_id)
+
+def on_unblock(db: Session, blocker_id: int, blocked_id: int):
+    # the pair's follows were hidden while blocked; bring back the ones still in the table
+    edges = db.execute(select(models.Follow.follower_id, models.Follow.followed_id).where(or_(
+        and_(models.Follow.follower_id == blocker_id, models.Follow.followed_id == blocked_id),
+        and_(models.Follow.follower_id == blocked_id, models.Follow.followed_id == blocker_id),
+    ))).all()
+    _queue(db, "unblock", blocker_id, [tuple(edge) for edge in edges])
+
+def on_user_deleted(db: Session, user_id: int):
+    _queue(db, "user_deleted", user_id, None)
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_events(session):
+    events = session.info.pop(_EVENTS_KEY, None)
+    if events:
+        graph.apply(events)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_events(session):
+    session.info.pop(_EVENTS_KEY, None)
+
+def load():
+    db = SessionLocal()
+    try:
+        graph.load(db)
+    finally:
+        db.close()
+
+_refresher = PeriodicTask("follow-graph-refresh", GRAPH_REFRESH_SECONDS, load)
+
+def start():
+    try:
+        load()
+    except Exception:
+        logger.exception("follow graph could not be loaded; starting empty")
+    _refresher.start()
+
+def shutdown():
+    _refresher.stop()
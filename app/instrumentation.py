@@ -0,0 +1,185 @@
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import event
+from dotenv import load_dotenv
+
+load_dotenv()
+# opt-in N+1 detector: flag a request that runs the same statement more than this many times (0 disables)
+SQL_REPEAT_THRESHOLD = int(os.getenv("SQL_REPEAT_THRESHOLD", "0"))
+# "log" writes a warning, "raise" raises RepeatedQueryError inside the offending request (useful in tests)
+SQL_REPEAT_MODE = os.getenv("SQL_REPEAT_MODE", "log")
+
+logger = logging.getLogger(__name__)
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200)
+
+class RepeatedQueryError(RuntimeError):
+    pass
+
+class RequestStats:
+    __slots__ = ("queries", "db_time", "statements", "scope", "flagged", "_started")
+
+    def __init__(self, scope: Optional[dict] = None):
+        self.queries = 0
+        self.db_time = 0.0
+        self.statements: Counter = Counter()
+        # the ASGI scope; the router adds the matched route to it before the endpoint runs
+        self.scope = scope or {}
+        self.flagged = False
+        self._started: Optional[float] = None
+
+_current: contextvars.ContextVar[Optional[RequestStats]] = contextvars.ContextVar("request_stats", default=None)
+
+def current() -> Optional[RequestStats]:
+    return _current.get()
+
+class Histogram:
+    def __init__(self, name: str, help_text: str, buckets):
+        self.name = name
+        self.help_text = help_text
+        self.buckets = buckets
+        self._series: Dict[Tuple, list] = {}
+
+    def observe(self, labels: Tuple, value: float):
+        series = self._series.get(labels)
+        if series is None:
+            # per-bucket counts, then sum and count
+            series = self._series[labels] = [0] * len(self.buckets) + [0.0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self, label_names: Tuple[str, ...]) -> str:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        for labels, series in sorted(self._series.items()):
+            base = ",".join(f'{k}="{_escape(v)}"' for k, v in zip(label_names, labels))
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{{{base},le="{bound}"}} {count}')
+            lines.append(f'{self.name}_bucket{{{base},le="+Inf"}} {series[-1]}')
+            lines.append(f"{self.name}_sum{{{base}}} {series[-2]}")
+            lines.append(f"{self.name}_count{{{base}}} {series[-1]}")
+        return "\n".join(lines)
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+_LABELS = ("method", "route")
+_lock = threading.Lock()
+_request_latency = Histogram("http_request_duration_seconds", "Request latency by route.", LATENCY_BUCKETS)
+_db_time = Histogram("db_time_seconds", "Total database time per request by route.", LATENCY_BUCKETS)
+_query_count = Histogram("db_queries_per_request", "SQL statements executed per request by route.", QUERY_BUCKETS)
+_responses: Counter = Counter()
+_repeats: Counter = Counter()
+_startup: Dict[str, float] = {}
+_dropped_activities = 0
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None:
+        return
+    stats._started = time.perf_counter()
+    stats.queries += 1
+    if SQL_REPEAT_THRESHOLD:
+        stats.statements[statement] += 1
+        if stats.statements[statement] > SQL_REPEAT_THRESHOLD and not stats.flagged:
+            stats.flagged = True
+            labels = (stats.scope.get("method", ""), _route_label(stats.scope))
+            message = (
+                f"{labels[0]} {stats.scope.get('path', '')} ({labels[1]}) ran the same statement "
+                f"{stats.statements[statement]} times: {statement[:200]}"
+            )
+            with _lock:
+                _repeats[labels] += 1
+            if SQL_REPEAT_MODE == "raise":
+                raise RepeatedQueryError(message)
+            logger.warning(message)
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    stats = _current.get()
+    if stats is None or stats._started is None:
+        return
+    stats.db_time += time.perf_counter() - stats._started
+    stats._started = None
+
+def record_dropped_activities(count: int):
+    global _dropped_activities
+    with _lock:
+        _dropped_activities += count
+
+def record_startup(phases: Dict[str, float]):
+    with _lock:
+        _startup.clear()
+        _startup.update(phases)
+
+def instrument_engine(engine):
+    event.listen(engine, "before_cursor_execute", _before_cursor_execute)
+    event.listen(engine, "after_cursor_execute", _after_cursor_execute)
+
+def _route_label(scope) -> str:
+    route = scope.get("route")
+    return getattr(route, "path", None) or "unmatched"
+
+class InstrumentationMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        stats = RequestStats(scope)
+        token = _current.set(stats)
+        start = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_timing(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+                elapsed = time.perf_counter() - start
+                timing = f"db;dur={stats.db_time * 1000:.2f};desc=\"{stats.queries} queries\", app;dur={elapsed * 1000:.2f}"
+                message.setdefault("headers", [])
+                message["headers"] = list(message["headers"]) + [(b"server-timing", timing.encode())]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            _current.reset(token)
+            labels = (scope.get("method", ""), _route_label(scope))
+            with _lock:
+                _request_latency.observe(labels, time.perf_counter() - start)
+                _db_time.observe(labels, stats.db_time)
+                _query_count.observe(labels, stats.queries)
+                _responses[labels + (str(status["code"]),)] += 1
+
+def render_metrics() -> str:
+    with _lock:
+        parts = [
+            _request_latency.render(_LABELS),
+            _db_time.render(_LABELS),
+            _query_count.render(_LABELS),
+            "# HELP http_responses_total Responses by route and status.\n# TYPE http_responses_total counter",
+        ]
+        parts.extend(
+            f'http_responses_total{{method="{_escape(m)}",route="{_escape(r)}",status="{s}"}} {n}'
+            for (m, r, s), n in sorted(_responses.items())
+        )
+        parts.append("# HELP db_repeated_statement_requests_total Requests flagged by the repeated-statement detector.\n# TYPE db_repeated_statement_requests_total counter")
+        parts.extend(
+            f'db_repeated_statement_requests_total{{method="{_escape(m)}",route="{_escape(r)}"}} {n}'
+            for (m, r), n in sorted(_repeats.items())
+        )
+        parts.append("# HELP activities_dropped_total Batched activity rows dropped after their writes kept failing.\n# TYPE activities_dropped_total counter")
+        parts.append(f"activities_dropped_total {_dropped_activities}")
+        parts.append("# HELP app_startup_seconds Time this worker spent in each startup phase.\n# TYPE app_startup_seconds gauge")
+        parts.extend(f'app_startup_seconds{{phase="{p}"}} {t:.6f}' for p, t in _startup.items())
+    return "\n".join(parts) + "\n"
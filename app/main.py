@@ -1,18 +1,64 @@
-from fastapi import FastAPI
-from app.database import init_db
+import logging
+import os
+import time
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
+from app import activity_writer, admission, follow_graph, instrumentation, migrations, search, trending, user_deletion, utils, warmup
 from app.routers import users, posts, admin, activities
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(title="Inkle - Social Activity Feed")
+# instrumentation wraps admission so shed requests still show up in the metrics
+app.add_middleware(admission.AdmissionMiddleware)
+app.add_middleware(instrumentation.InstrumentationMiddleware)
 
 @app.on_event("startup")
 def on_startup():
-    init_db()
+    # the worker reports ready once every phase is done; the timings go to the log and to /metrics
+    phases = {}
+    for name, step in (
+        ("schema", migrations.check),
+        ("deletion_jobs", user_deletion.resume_pending),
+        ("trending", trending.start),
+        ("follow_graph", follow_graph.start),
+        ("search", search.start),
+        ("warmup", warmup.run),
+    ):
+        started = time.perf_counter()
+        step()
+        phases[name] = time.perf_counter() - started
+    phases["total"] = sum(phases.values())
+    instrumentation.record_startup(phases)
+    logger.info("worker %d ready in %.3fs (%s)", os.getpid(), phases["total"],
+                ", ".join(f"{name} {seconds:.3f}s" for name, seconds in phases.items() if name != "total"))
+
+@app.on_event("shutdown")
+def on_shutdown():
+    user_deletion.shutdown()
+    trending.shutdown()
+    follow_graph.shutdown()
+    search.shutdown()
+    activity_writer.shutdown()
+
+@app.exception_handler(utils.PasswordHasherBusy)
+async def password_hasher_busy(request: Request, exc: utils.PasswordHasherBusy):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": "Authentication is busy, retry shortly"},
+        headers={"Retry-After": str(utils.PASSWORD_HASH_RETRY_AFTER)},
+    )
 
 app.include_router(users.router)
 app.include_router(posts.router)
 app.include_router(admin.router)
 app.include_router(activities.router)
 
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    return PlainTextResponse(instrumentation.render_metrics(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def root():
     return {"msg": "inkle backend running. See /docs for interactive API."}
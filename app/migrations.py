@@ -0,0 +1,183 @@
+import argparse
+import logging
+import os
+import time
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Callable, List, Optional, Tuple
+
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, func, inspect, insert, select, text
+from sqlalchemy.engine import Connection, make_url
+from dotenv import load_dotenv
+
+from . import counters, models, search
+from .database import Base, DATABASE_URL, engine
+
+try:
+    import fcntl
+except ImportError:  # Windows: SQLite migrations run without the file lock
+    fcntl = None
+
+load_dotenv()
+# apply pending migrations when a worker starts; set to false when deploys run `python -m app.migrations upgrade`
+# once, and workers then only check the schema version
+MIGRATE_ON_STARTUP = os.getenv("MIGRATE_ON_STARTUP", "true").lower() in ("1", "true", "yes")
+# PostgreSQL advisory lock key held while migrations run
+MIGRATION_LOCK_KEY = int(os.getenv("MIGRATION_LOCK_KEY", "72616"))
+
+logger = logging.getLogger(__name__)
+
+# kept off Base.metadata so create_all and drop_all leave the version history alone
+schema_migrations = Table(
+    "schema_migrations", MetaData(),
+    Column("version", Integer, primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+def _columns(conn: Connection, table_name: str) -> set:
+    return {c["name"] for c in inspect(conn).get_columns(table_name)}
+
+def _add_column(conn: Connection, column) -> bool:
+    if column.name in _columns(conn, column.table.name):
+        return False
+    spec = conn.dialect.ddl_compiler(conn.dialect, None).get_column_specification(column)
+    conn.execute(text(f"ALTER TABLE {column.table.name} ADD COLUMN {spec}"))
+    return True
+
+# every migration must also work on a schema that create_all already built from the current models, so each one
+# checks before it changes anything
+
+def _create_tables(conn: Connection):
+    # the original tables plus timeline_entries, user_deletion_jobs and trending_scores
+    Base.metadata.create_all(conn)
+
+def _add_post_updated_at(conn: Connection):
+    if _add_column(conn, models.Post.updated_at):
+        posts = models.Post.__table__
+        conn.execute(posts.update().values(updated_at=posts.c.created_at))
+
+def _add_counters(conn: Connection):
+    added = [_add_column(conn, column) for column in (
+        models.Post.like_count, models.User.follower_count, models.User.following_count,
+    )]
+    if any(added):
+        counters.recount(conn)
+
+def _add_user_deleting(conn: Connection):
+    _add_column(conn, models.User.deleting)
+    # accounts with a deletion job already queued
+    active = select(models.UserDeletionJob.user_id).where(models.UserDeletionJob.status.in_(
+        (models.DeletionStatus.pending, models.DeletionStatus.running)
+    ))
+    users = models.User.__table__
+    conn.execute(users.update().where(users.c.id.in_(active)).values(deleting=True))
+
+def _create_indexes(conn: Connection):
+    # ix_posts_deleted_created_id, ix_posts_updated_at, ix_activities_created_id, ix_likes_created_at,
+    # ix_follows_followed_id and anything else declared on the models
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(conn, checkfirst=True)
+
+def _add_search_vector(conn: Connection):
+    if conn.dialect.name == "postgresql":
+        search.create_search_vector(conn)
+
+Migration = Tuple[int, str, Callable[[Connection], None]]
+
+MIGRATIONS: List[Migration] = [
+    (1, "create tables", _create_tables),
+    # before the counters: recounting like_count through the model also sets posts.updated_at
+    (2, "posts.updated_at", _add_post_updated_at),
+    (3, "like and follower counters", _add_counters),
+    (4, "model indexes", _create_indexes),
+    (5, "posts.search_vector", _add_search_vector),
+    (6, "users.deleting", _add_user_deleting),
+    (7, "ix_posts_owner_created", _create_indexes),
+]
+HEAD = MIGRATIONS[-1][0]
+
+@contextmanager
+def _lock(conn: Connection):
+    # one runner per database: the others wait here, then find nothing left to apply
+    if conn.dialect.name == "postgresql":
+        conn.execute(text("SELECT pg_advisory_lock(:key)"), {"key": MIGRATION_LOCK_KEY})
+        conn.commit()
+        try:
+            yield
+        finally:
+            conn.rollback()
+            conn.execute(text("SELECT pg_advisory_unlock(:key)"), {"key": MIGRATION_LOCK_KEY})
+            conn.commit()
+        return
+    database = make_url(DATABASE_URL).database
+    if conn.dialect.name != "sqlite" or not database or database == ":memory:" or fcntl is None:
+        yield
+        return
+    with open(database + ".migrate.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+def current_version(conn: Connection) -> int:
+    if not inspect(conn).has_table(schema_migrations.name):
+        return 0
+    return conn.execute(select(func.max(schema_migrations.c.version))).scalar() or 0
+
+def upgrade() -> List[int]:
+    applied = []
+    with engine.connect() as conn, _lock(conn):
+        schema_migrations.create(conn, checkfirst=True)
+        conn.commit()
+        done = set(conn.execute(select(schema_migrations.c.version)).scalars())
+        for version, name, migrate in MIGRATIONS:
+            if version in done:
+                continue
+            started = time.perf_counter()
+            migrate(conn)
+            conn.execute(insert(schema_migrations).values(version=version, name=name, applied_at=datetime.utcnow()))
+            # PostgreSQL runs the DDL and the version row in one transaction
+            conn.commit()
+            logger.info("applied migration %d (%s) in %.3fs", version, name, time.perf_counter() - started)
+            applied.append(version)
+    return applied
+
+def check() -> int:
+    # worker startup: a single version lookup when the schema is current
+    with engine.connect() as conn:
+        version = current_version(conn)
+    if version >= HEAD:
+        return version
+    if not MIGRATE_ON_STARTUP:
+        raise RuntimeError(
+            f"database schema is at version {version}, this build needs {HEAD}; run `python -m app.migrations upgrade`"
+        )
+    upgrade()
+    return HEAD
+
+def status() -> List[dict]:
+    with engine.connect() as conn:
+        if not inspect(conn).has_table(schema_migrations.name):
+            rows = {}
+        else:
+            rows = dict(conn.execute(select(schema_migrations.c.version, schema_migrations.c.applied_at)).all())
+    return [{"version": v, "name": name, "applied_at": rows.get(v)} for v, name, _ in MIGRATIONS]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Apply or list schema migrations")
+    parser.add_argument("command", choices=("upgrade", "status"), nargs="?", default="upgrade",
+                        help="upgrade: apply pending migrations (run once per deploy); status: list migrations")
+    args = parser.parse_args(argv)
+    if args.command == "upgrade":
+        applied = upgrade()
+        print(f"applied {applied}" if applied else f"schema is current (version {HEAD})")
+    else:
+        for entry in status():
+            state = entry["applied_at"].isoformat() if entry["applied_at"] else "pending"
+            print(f"{entry['version']:>3} {entry['name']}: {state}")
+
+if __name__ == "__main__":
+    main()
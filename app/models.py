@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Text, Enum, UniqueConstraint
+from sqlalchemy import Column, Integer, String, ForeignKey, Boolean, DateTime, Float, Text, Enum, UniqueConstraint, Index
 from sqlalchemy.orm import relationship
 from datetime import datetime
 import enum
@@ -17,6 +17,10 @@ class User(Base):
     hashed_password = Column(String(255), nullable=False)
     role = Column(Enum(RoleEnum), default=RoleEnum.user, nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
+    follower_count = Column(Integer, default=0, server_default="0", nullable=False)
+    following_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # set when a deletion job is scheduled; the account can no longer log in or act while its rows are removed
+    deleting = Column(Boolean, default=False, server_default="0", nullable=False)
 
     posts = relationship("Post", back_populates="owner", cascade="all, delete-orphan")
     followers = relationship("Follow", foreign_keys="Follow.followed_id", back_populates="followed", cascade="all, delete-orphan")
@@ -32,16 +36,23 @@ class Post(Base):
     owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     created_at = Column(DateTime, default=datetime.utcnow)
     deleted = Column(Boolean, default=False)
+    like_count = Column(Integer, default=0, server_default="0", nullable=False)
+    updated_at = Column(DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
 
     owner = relationship("User", back_populates="posts")
     likes = relationship("Like", back_populates="post", cascade="all, delete-orphan")
+    __table_args__ = (
+        Index('ix_posts_deleted_created_id', 'deleted', 'created_at', 'id'),
+        # per-author reads: timeline backfill and rebuild, celebrity pull, user deletion
+        Index('ix_posts_owner_created', 'owner_id', 'created_at', 'id'),
+    )
 
 class Like(Base):
     __tablename__ = "likes"
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
     post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False)
-    created_at = Column(DateTime, default=datetime.utcnow)
+    created_at = Column(DateTime, default=datetime.utcnow, index=True)
 
     user = relationship("User", back_populates="likes")
     post = relationship("Post", back_populates="likes")
@@ -51,7 +62,7 @@ class Follow(Base):
     __tablename__ = "follows"
     id = Column(Integer, primary_key=True, index=True)
     follower_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
-    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    followed_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
     created_at = Column(DateTime, default=datetime.utcnow)
 
     follower = relationship("User", foreign_keys=[follower_id], back_populates="following")
@@ -69,6 +80,19 @@ class Block(Base):
     blocked = relationship("User", foreign_keys=[blocked_id], back_populates="blocked_by")
     __table_args__ = (UniqueConstraint('blocker_id', 'blocked_id', name='_blocker_blocked_uc'),)
 
+class TimelineEntry(Base):
+    __tablename__ = "timeline_entries"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), nullable=False, index=True)
+    owner_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False)
+    created_at = Column(DateTime, nullable=False)
+
+    __table_args__ = (
+        UniqueConstraint('user_id', 'post_id', name='_timeline_user_post_uc'),
+        Index('ix_timeline_user_created', 'user_id', 'created_at'),
+    )
+
 class ActivityType(str, enum.Enum):
     post = "post"
     follow = "follow"
@@ -86,3 +110,31 @@ class Activity(Base):
     target_post_id = Column(Integer, ForeignKey("posts.id", ondelete="SET NULL"), nullable=True)
     created_at = Column(DateTime, default=datetime.utcnow)
     extra = Column(Text, nullable=True)
+
+    __table_args__ = (Index('ix_activities_created_id', 'created_at', 'id'),)
+
+class TrendingScore(Base):
+    # periodic snapshot of trending scores, as decayed like counts at taken_at
+    __tablename__ = "trending_scores"
+    post_id = Column(Integer, ForeignKey("posts.id", ondelete="CASCADE"), primary_key=True)
+    score = Column(Float, nullable=False)
+    taken_at = Column(DateTime, nullable=False)
+
+class DeletionStatus(str, enum.Enum):
+    pending = "pending"
+    running = "running"
+    done = "done"
+    failed = "failed"
+
+class UserDeletionJob(Base):
+    __tablename__ = "user_deletion_jobs"
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, nullable=False, index=True)
+    username = Column(String(50), nullable=False)
+    requested_by = Column(Integer, nullable=True)
+    status = Column(Enum(DeletionStatus), default=DeletionStatus.pending, nullable=False)
+    deleted_rows = Column(Integer, default=0, nullable=False)
+    error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+    finished_at = Column(DateTime, nullable=True)
@@ -0,0 +1,54 @@
+import hashlib
+import os
+from typing import Optional
+
+from sqlalchemy.orm import Session, make_transient_to_detached
+from dotenv import load_dotenv
+
+from . import models
+from .cache import TTLCache
+from .database import is_primary
+
+load_dotenv()
+PRINCIPAL_CACHE_SIZE = int(os.getenv("PRINCIPAL_CACHE_SIZE", "10000"))
+PRINCIPAL_CACHE_TTL_SECONDS = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "30"))
+# when set, a cached principal is only reused for the token it was loaded with
+PRINCIPAL_CACHE_BIND_TOKEN = os.getenv("PRINCIPAL_CACHE_BIND_TOKEN", "false").lower() in ("1", "true", "yes")
+
+# user_id -> (token hash or None, column snapshot of the users row)
+_cache = TTLCache(PRINCIPAL_CACHE_SIZE, PRINCIPAL_CACHE_TTL_SECONDS)
+_COLUMNS = [c.key for c in models.User.__table__.columns]
+
+def _token_hash(token: str) -> Optional[str]:
+    if not PRINCIPAL_CACHE_BIND_TOKEN:
+        return None
+    return hashlib.sha256(token.encode()).hexdigest()
+
+def get_principal(db: Session, user_id: int, token: str) -> Optional[models.User]:
+    # accounts being deleted are treated as gone
+    token_hash = _token_hash(token)
+    entry = _cache.get(user_id)
+    if entry is not None and entry[0] == token_hash:
+        if entry[1]["deleting"]:
+            return None
+        # rebuild a detached instance and attach it without a SELECT; cached objects are never shared across sessions
+        user = models.User(**entry[1])
+        make_transient_to_detached(user)
+        return db.merge(user, load=False)
+    user = db.query(models.User).filter(models.User.id == user_id).first()
+    if user is None:
+        return None
+    # a replica miss is served from the replica but left uncached
+    if is_primary(db):
+        _cache.set(user_id, (token_hash, {key: getattr(user, key) for key in _COLUMNS}))
+    return None if user.deleting else user
+
+def invalidate(*user_ids: int):
+    for user_id in user_ids:
+        _cache.pop(user_id)
+
+def clear():
+    _cache.clear()
+
+def stats() -> dict:
+    return _cache.stats()
@@ -1,11 +1,115 @@
-from fastapi import APIRouter, Depends
+import asyncio
+import json
+import os
+import time
+from typing import Optional
+from fastapi import APIRouter, Depends, Header, Request
+from fastapi.responses import StreamingResponse
+from fastapi.security import HTTPAuthorizationCredentials
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.orm import Session
-from app import schemas, crud
-from app.deps import get_db, get_current_user
+from app import schemas, crud, models, pagination, serialization, conditional, blocklist
+from app.broker import SeenIds, activity_event, broker
+from app.database import ReadSessionLocal, read_engine
+from app.deps import get_read_db, get_current_reader, security, _authenticate, _token_user_id
 
 router = APIRouter(prefix="/api/activities", tags=["activities"])
 
+# seconds between keepalive comments on an idle stream
+STREAM_KEEPALIVE_SECONDS = float(os.getenv("STREAM_KEEPALIVE_SECONDS", "15"))
+# how often a stream re-reads the viewer's block set
+STREAM_BLOCK_REFRESH_SECONDS = float(os.getenv("STREAM_BLOCK_REFRESH_SECONDS", "30"))
+# most events replayed from the database for a reconnect the in-memory buffer cannot cover
+STREAM_REPLAY_MAX = int(os.getenv("STREAM_REPLAY_MAX", "1000"))
+
 @router.get("/global", response_model=list[schemas.ActivityOut])
-def global_activity(limit: int = 50, db: Session = Depends(get_db), current_user = Depends(get_current_user)):
-    acts = crud.get_global_activity(db, limit=limit)
-    return acts
+def global_activity(request: Request, limit: int = 50, cursor: Optional[str] = None, db: Session = Depends(get_read_db), current_user = Depends(get_current_reader)):
+    limit = pagination.clamp_limit(limit)
+    before = pagination.decode_cursor(cursor)
+    fast = serialization.enabled("activities")
+    etag = conditional.make_etag("activities", limit, cursor, conditional.activities_watermark(db))
+
+    def render():
+        columns = serialization.columns(schemas.ActivityOut, models.Activity) if fast else None
+        acts = crud.get_global_activity(db, limit=limit, before=before, columns=columns)
+        return serialization.render(schemas.ActivityOut, acts, fast), pagination.next_cursor(acts, limit)
+
+    return conditional.page_response(request, etag, render)
+
+def _stream_viewer(token: str) -> int:
+    # a short-lived session: the stream can stay open for hours and must not pin a pooled connection
+    db = ReadSessionLocal(bind=read_engine(_token_user_id(token)))
+    try:
+        return _authenticate(token, db).id
+    finally:
+        db.close()
+
+def _load_block_set(user_id: int):
+    db = ReadSessionLocal(bind=read_engine(user_id))
+    try:
+        return blocklist.get_block_set(db, user_id)
+    finally:
+        db.close()
+
+def _load_after(user_id: int, after_id: int):
+    db = ReadSessionLocal(bind=read_engine(user_id))
+    try:
+        return [activity_event(a) for a in crud.get_activities_after(db, after_id, STREAM_REPLAY_MAX)]
+    finally:
+        db.close()
+
+def _frame(event: dict) -> str:
+    return f"id: {event['id']}\nevent: activity\ndata: {json.dumps(event, separators=(',', ':'))}\n\n"
+
+@router.get("/stream")
+async def stream_activities(
+    request: Request,
+    last_event_id: Optional[int] = None,
+    last_event_id_header: Optional[int] = Header(None, alias="Last-Event-ID"),
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+):
+    """Server-Sent Events stream of new activities, resumable with Last-Event-ID."""
+    viewer_id = await run_in_threadpool(_stream_viewer, credentials.credentials)
+    after_id = last_event_id_header if last_event_id_header is not None else last_event_id
+
+    async def events():
+        sub = broker.subscribe()
+        try:
+            blocked = await run_in_threadpool(_load_block_set, viewer_id)
+            blocks_loaded = time.monotonic()
+            # ids can be published out of order, so duplicates are tracked per id rather than with a high-water mark
+            seen = SeenIds()
+            if after_id is not None:
+                # subscribed first, so nothing published from here on is missed; the replayed ids are skipped live
+                backlog = broker.replay(after_id)
+                if backlog is None:
+                    backlog = await run_in_threadpool(_load_after, viewer_id, after_id)
+                for event in backlog:
+                    seen.add(event["id"])
+                    if event["actor_id"] not in blocked and event["target_user_id"] not in blocked:
+                        yield _frame(event)
+            yield "retry: 3000\n\n"
+            while True:
+                try:
+                    event = await sub.get(STREAM_KEEPALIVE_SECONDS)
+                except asyncio.TimeoutError:
+                    if await request.is_disconnected():
+                        return
+                    yield ": keepalive\n\n"
+                    continue
+                if event is None:
+                    # dropped as a slow consumer; the client reconnects and replays from its last id
+                    return
+                if event["id"] in seen:
+                    continue
+                if time.monotonic() - blocks_loaded > STREAM_BLOCK_REFRESH_SECONDS:
+                    blocked = await run_in_threadpool(_load_block_set, viewer_id)
+                    blocks_loaded = time.monotonic()
+                seen.add(event["id"])
+                if event["actor_id"] in blocked or event["target_user_id"] in blocked:
+                    continue
+                yield _frame(event)
+        finally:
+            broker.unsubscribe(sub)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
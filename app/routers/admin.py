@@ -1,6 +1,10 @@
+from datetime import datetime
+from typing import Optional
 from fastapi import APIRouter, Depends, HTTPException
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app import models, crud
+from app import models, schemas, crud, principal_cache, blocklist, export, user_deletion, admission, trending, follow_graph, search, activity_archive
+from app.broker import broker
 from app.deps import get_db, require_role
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
@@ -16,26 +20,28 @@ def admin_delete_post(post_id: int, db: Session = Depends(get_db), admin_user: m
     crud.delete_post(db, post, actor_id=admin_user.id)
     return {"detail": "post marked deleted"}
 
-@router.delete("/users/{username}")
+@router.delete("/users/{username}", status_code=202, response_model=schemas.UserDeletionJobOut)
 def admin_delete_user(username: str, db: Session = Depends(get_db), admin_user: models.User = Depends(admin_required)):
     target = crud.get_user_by_username(db, username)
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
     if target.role == models.RoleEnum.owner and admin_user.role != models.RoleEnum.owner:
         raise HTTPException(status_code=403, detail="Cannot delete owner")
-    crud.delete_user(db, target)
-    activity = models.Activity(actor_id=admin_user.id, verb=models.ActivityType.delete_user, target_user_id=target.id)
-    db.add(activity); db.commit()
-    return {"detail": "user deleted"}
+    return user_deletion.schedule(db, target, requested_by=admin_user.id)
+
+@router.get("/deletion-jobs/{job_id}", response_model=schemas.UserDeletionJobOut)
+def deletion_job_status(job_id: int, db: Session = Depends(get_db), admin_user: models.User = Depends(admin_required)):
+    job = user_deletion.get_job(db, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
 
 @router.post("/owners/create-admin/{username}")
 def owner_create_admin(username: str, db: Session = Depends(get_db), owner: models.User = Depends(require_role(models.RoleEnum.owner))):
     target = crud.get_user_by_username(db, username)
     if not target:
         raise HTTPException(status_code=404, detail="User not found")
-    target.role = models.RoleEnum.admin
-    db.add(target)
-    db.commit()
+    crud.set_role(db, target, models.RoleEnum.admin)
     return {"detail": f"{username} promoted to admin"}
 
 @router.delete("/owners/remove-admin/{username}")
@@ -45,7 +51,61 @@ def owner_remove_admin(username: str, db: Session = Depends(get_db), owner: mode
         raise HTTPException(status_code=404, detail="User not found")
     if target.role != models.RoleEnum.admin:
         raise HTTPException(status_code=400, detail="User is not an admin")
-    target.role = models.RoleEnum.user
-    db.add(target)
-    db.commit()
+    crud.set_role(db, target, models.RoleEnum.user)
     return {"detail": f"{username} demoted from admin"}
+
+@router.get("/stats/caches")
+def cache_stats(admin_user: models.User = Depends(admin_required)):
+    return {
+        "principal": principal_cache.stats(),
+        "blocks": blocklist.stats(),
+        "stream": broker.stats(),
+        "trending": trending.scorer.stats(),
+        "follow_graph": follow_graph.graph.stats(),
+        "search": search.stats(),
+    }
+
+@router.get("/stats/admission")
+def admission_stats(admin_user: models.User = Depends(admin_required)):
+    return admission.stats()
+
+@router.get("/export/{table}")
+def export_table(
+    table: str,
+    format: str = "ndjson",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    after_id: Optional[int] = None,
+    admin_user: models.User = Depends(admin_required),
+):
+    if table not in export.EXPORTABLE:
+        raise HTTPException(status_code=404, detail="Unknown export")
+    if format not in export.EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail="format must be ndjson or csv")
+    rows = export.stream_table(table, fmt=format, since=since, until=until, after_id=after_id)
+    return StreamingResponse(rows, media_type=export.EXPORT_FORMATS[format])
+
+@router.get("/archive/activities")
+def archived_activity_months(admin_user: models.User = Depends(admin_required)):
+    return activity_archive.archived_months()
+
+@router.get("/archive/activities/query")
+def query_archived_activities(
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    verb: Optional[str] = None,
+    actor_id: Optional[int] = None,
+    target_user_id: Optional[int] = None,
+    target_post_id: Optional[int] = None,
+    limit: int = 1000,
+    admin_user: models.User = Depends(admin_required),
+):
+    rows = activity_archive.query_archive(
+        since=since, until=until, verb=verb, actor_id=actor_id,
+        target_user_id=target_user_id, target_post_id=target_post_id, limit=max(1, min(limit, 100000)),
+    )
+    return StreamingResponse(rows, media_type=export.EXPORT_FORMATS["ndjson"])
+
+@router.post("/archive/activities/maintain")
+def run_activity_maintenance(admin_user: models.User = Depends(admin_required)):
+    return activity_archive.maintain()
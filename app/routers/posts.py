@@ -1,7 +1,8 @@
-from fastapi import APIRouter, Depends, HTTPException
+from typing import Optional
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
 from sqlalchemy.orm import Session
-from app import schemas, crud, models
-from app.deps import get_db, get_current_user
+from app import schemas, crud, models, pagination, serialization, conditional, bulk, trending, search
+from app.deps import get_db, get_read_db, get_current_user, get_current_reader
 
 router = APIRouter(prefix="/api/posts", tags=["posts"])
 
@@ -10,8 +11,38 @@ def create_post(payload: schemas.PostCreate, db: Session = Depends(get_db), curr
     post = crud.create_post(db, owner=current_user, content=payload.content)
     return post
 
+@router.post("/likes:batch", response_model=schemas.BatchOut)
+def like_batch(payload: schemas.LikeBatchIn, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    post_ids = list(dict.fromkeys(payload.post_ids))
+    if len(post_ids) > bulk.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {bulk.BULK_MAX_ITEMS} posts per batch")
+    results = crud.like_posts(db, user=current_user, post_ids=post_ids)
+    return {"results": [{"target": post_id, "status": results[post_id]} for post_id in post_ids]}
+
+@router.get("/timeline", response_model=list[schemas.PostOut])
+def home_timeline(db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    posts = crud.get_home_timeline(db, viewer=current_user, limit=100)
+    return posts
+
+@router.get("/trending", response_model=list[schemas.PostOut])
+def trending_posts(limit: int = 20, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    limit = max(1, min(limit, trending.TRENDING_TOP_K))
+    # rank in memory; the database only hydrates the top-K ids and drops deleted or blocked posts
+    ranked = [post_id for post_id, _ in trending.scorer.top(trending.TRENDING_TOP_K)]
+    return crud.get_posts_by_ids(db, viewer=current_user, post_ids=ranked)[:limit]
+
+@router.get("/search", response_model=list[schemas.PostOut])
+def search_posts(response: Response, q: str = Query(..., min_length=1, max_length=200), limit: int = 20, cursor: Optional[str] = None, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    limit = pagination.clamp_limit(limit)
+    after = pagination.decode_rank_cursor(cursor)
+    results = search.search(db, current_user.id, q, after, limit)
+    if len(results) == limit:
+        post, score = results[-1]
+        response.headers[pagination.NEXT_CURSOR_HEADER] = pagination.encode_rank_cursor(score, post.id)
+    return [post for post, _ in results]
+
 @router.get("/{post_id}", response_model=schemas.PostOut)
-def get_post(post_id: int, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+def get_post(post_id: int, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
     post = crud.get_post(db, post_id)
     if not post or post.deleted:
         raise HTTPException(status_code=404, detail="Post not found")
@@ -40,6 +71,15 @@ def unlike(post_id: int, db: Session = Depends(get_db), current_user: models.Use
     return {"detail": "unliked"}
 
 @router.get("/", response_model=list[schemas.PostOut])
-def feed(db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
-    posts = crud.get_posts_for_user(db, viewer=current_user, limit=100)
-    return posts
+def feed(request: Request, limit: int = 100, cursor: Optional[str] = None, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    limit = pagination.clamp_limit(limit)
+    before = pagination.decode_cursor(cursor)
+    fast = serialization.enabled("posts")
+    etag = conditional.make_etag("posts", limit, cursor, conditional.posts_watermark(db), conditional.block_state(db, current_user.id))
+
+    def render():
+        columns = serialization.columns(schemas.PostOut, models.Post) if fast else None
+        posts = crud.get_posts_for_user(db, viewer=current_user, limit=limit, before=before, columns=columns)
+        return serialization.render(schemas.PostOut, posts, fast), pagination.next_cursor(posts, limit)
+
+    return conditional.page_response(request, etag, render)
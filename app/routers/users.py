@@ -1,8 +1,8 @@
 from fastapi import APIRouter, Depends, HTTPException, status
 from sqlalchemy.orm import Session
-from app import schemas, crud, auth, models
-from app.deps import get_db, get_current_user
-from app.utils import verify_password, hash_password
+from app import schemas, crud, auth, models, bulk, blocklist, follow_graph
+from app.deps import get_db, get_read_db, get_current_user, get_current_reader
+from app.utils import verify_and_update_password
 
 router = APIRouter(prefix="/api/users", tags=["users"])
 
@@ -19,15 +19,60 @@ def signup(user_in: schemas.UserCreate, db: Session = Depends(get_db)):
 def login(form_data: schemas.UserCreate, db: Session = Depends(get_db)):
     # simple JSON-based login: username OR email in 'username' field + password
     user = crud.get_user_by_username(db, form_data.username) or crud.get_user_by_email(db, form_data.username)
-    if not user or not verify_password(form_data.password, user.hashed_password):
+    if not user or user.deleting:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect credentials")
+    valid, new_hash = verify_and_update_password(form_data.password, user.hashed_password)
+    if not valid:
+        raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail="Incorrect credentials")
+    if new_hash:
+        crud.update_password_hash(db, user, new_hash)
     token = auth.create_access_token({"user_id": user.id})
     return {"access_token": token, "token_type": "bearer"}
 
 @router.get("/me", response_model=schemas.UserOut)
-def read_me(current_user: models.User = Depends(get_current_user)):
+def read_me(current_user: models.User = Depends(get_current_reader)):
     return current_user
 
+@router.get("/suggestions", response_model=list[schemas.SuggestionOut])
+def suggestions(limit: int = 20, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    limit = max(1, min(limit, 100))
+    blocked = blocklist.get_block_set(db, current_user.id)
+    # ask for extra candidates: some ids may belong to accounts deleted since the graph was loaded
+    ranked = follow_graph.graph.suggestions(current_user.id, exclude=set(blocked), limit=limit * 2)
+    names = crud.get_usernames(db, [user_id for user_id, _ in ranked])
+    return [
+        {"id": user_id, "username": names[user_id], "mutual_count": count}
+        for user_id, count in ranked if user_id in names
+    ][:limit]
+
+@router.get("/{username}/relationship", response_model=schemas.RelationshipOut)
+def relationship(username: str, limit: int = 3, db: Session = Depends(get_read_db), current_user: models.User = Depends(get_current_reader)):
+    other = crud.get_user_by_username(db, username)
+    if not other:
+        raise HTTPException(status_code=404, detail="User not found")
+    limit = max(0, min(limit, 20))
+    graph = follow_graph.graph
+    following = graph.follows(current_user.id, other.id)
+    followed_by = graph.follows(other.id, current_user.id)
+    via = graph.followed_by_friends(current_user.id, other.id)
+    names = crud.get_usernames(db, via[:limit * 2])
+    return {
+        "username": other.username,
+        "following": following,
+        "followed_by": followed_by,
+        "mutual": following and followed_by,
+        "followed_by_following": [names[user_id] for user_id in via if user_id in names][:limit],
+        "followed_by_following_count": len(via),
+    }
+
+@router.post("/follows:batch", response_model=schemas.BatchOut)
+def follow_batch(payload: schemas.FollowBatchIn, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
+    usernames = list(dict.fromkeys(payload.usernames))
+    if len(usernames) > bulk.BULK_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"At most {bulk.BULK_MAX_ITEMS} users per batch")
+    results = crud.follow_users(db, follower=current_user, usernames=usernames)
+    return {"results": [{"target": username, "status": results[username]} for username in usernames]}
+
 @router.post("/{username}/follow", status_code=201)
 def follow(username: str, db: Session = Depends(get_db), current_user: models.User = Depends(get_current_user)):
     other = crud.get_user_by_username(db, username)
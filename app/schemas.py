@@ -1,5 +1,5 @@
-from pydantic import BaseModel, EmailStr
-from typing import Optional, List
+from pydantic import BaseModel, EmailStr, StrictInt, StrictStr
+from typing import Optional, List, Union
 from datetime import datetime
 from enum import Enum
 
@@ -19,6 +19,8 @@ class UserOut(BaseModel):
     email: EmailStr
     role: Role
     created_at: datetime
+    follower_count: int = 0
+    following_count: int = 0
 
     class Config:
         orm_mode = True
@@ -39,10 +41,37 @@ class PostOut(BaseModel):
     owner_id: int
     created_at: datetime
     deleted: bool
+    like_count: int = 0
 
     class Config:
         orm_mode = True
 
+class SuggestionOut(BaseModel):
+    id: int
+    username: str
+    mutual_count: int
+
+class RelationshipOut(BaseModel):
+    username: str
+    following: bool
+    followed_by: bool
+    mutual: bool
+    followed_by_following: List[str]
+    followed_by_following_count: int
+
+class LikeBatchIn(BaseModel):
+    post_ids: List[int]
+
+class FollowBatchIn(BaseModel):
+    usernames: List[str]
+
+class BatchItemOut(BaseModel):
+    target: Union[StrictInt, StrictStr]
+    status: str
+
+class BatchOut(BaseModel):
+    results: List[BatchItemOut]
+
 class ActivityOut(BaseModel):
     id: int
     actor_id: Optional[int]
@@ -54,3 +83,18 @@ class ActivityOut(BaseModel):
 
     class Config:
         orm_mode = True
+
+class UserDeletionJobOut(BaseModel):
+    id: int
+    user_id: int
+    username: str
+    requested_by: Optional[int]
+    status: str
+    deleted_rows: int
+    error: Optional[str]
+    created_at: datetime
+    updated_at: Optional[datetime]
+    finished_at: Optional[datetime]
+
+    class Config:
+        orm_mode = True
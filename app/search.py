@@ -0,0 +1,201 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import Dict, FrozenSet, List, Optional, Tuple
+
+from sqlalchemy import event, func, literal_column, select, text, tuple_
+from sqlalchemy.engine import Connection
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models, blocklist, pagination
+from .background import PeriodicTask
+from .database import SessionLocal, engine
+
+load_dotenv()
+# "postgres" uses a generated tsvector column with a GIN index, "memory" an in-process BM25 inverted index;
+# "auto" picks postgres on PostgreSQL and memory everywhere else
+SEARCH_BACKEND = os.getenv("SEARCH_BACKEND", "auto")
+SEARCH_LANGUAGE = os.getenv("SEARCH_LANGUAGE", "english")
+# how often the in-process index picks up posts created through other workers
+SEARCH_REFRESH_SECONDS = float(os.getenv("SEARCH_REFRESH_SECONDS", "30"))
+
+_EVENTS_KEY = "search_events"
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+def backend() -> str:
+    if SEARCH_BACKEND != "auto":
+        return SEARCH_BACKEND
+    return "postgres" if engine.dialect.name == "postgresql" else "memory"
+
+def tokenize(value: str) -> List[str]:
+    return [token for token in _TOKEN.findall(value.lower()) if len(token) > 1]
+
+class InvertedIndex:
+    def __init__(self):
+        self.postings: Dict[str, Dict[int, int]] = {}
+        self.lengths: Dict[int, int] = {}
+        self.owners: Dict[int, int] = {}
+        self.total_length = 0
+        self.max_id = 0
+        # highest post id catch_up has read; unlike max_id it ignores posts indexed from this worker's own commits
+        self.caught_up_id = 0
+        self._lock = threading.Lock()
+
+    def add(self, post_id: int, owner_id: int, content: str):
+        terms = Counter(tokenize(content))
+        with self._lock:
+            if post_id in self.lengths:
+                return
+            for term, tf in terms.items():
+                self.postings.setdefault(term, {})[post_id] = tf
+            length = sum(terms.values())
+            self.lengths[post_id] = length
+            self.owners[post_id] = owner_id
+            self.total_length += length
+            self.max_id = max(self.max_id, post_id)
+
+    def remove(self, post_id: int):
+        with self._lock:
+            length = self.lengths.pop(post_id, None)
+            if length is None:
+                return
+            self.owners.pop(post_id, None)
+            self.total_length -= length
+            # walk the vocabulary once per delete; deletes are rare next to searches
+            for term in [term for term, docs in self.postings.items() if docs.pop(post_id, None) is not None and not docs]:
+                del self.postings[term]
+
+    def search(self, query: str, blocked: FrozenSet[int], after: Optional[pagination.RankCursor], limit: int) -> List[Tuple[int, float]]:
+        terms = set(tokenize(query))
+        with self._lock:
+            n = len(self.lengths)
+            if not n or not terms:
+                return []
+            average = self.total_length / n
+            scores: Dict[int, float] = {}
+            for term in terms:
+                docs = self.postings.get(term)
+                if not docs:
+                    continue
+                idf = math.log(1 + (n - len(docs) + 0.5) / (len(docs) + 0.5))
+                for post_id, tf in docs.items():
+                    norm = tf + BM25_K1 * (1 - BM25_B + BM25_B * self.lengths[post_id] / average)
+                    scores[post_id] = scores.get(post_id, 0.0) + idf * tf * (BM25_K1 + 1) / norm
+            owners = self.owners
+        ranked = sorted(
+            ((post_id, round(score, 6)) for post_id, score in scores.items() if owners.get(post_id) not in blocked),
+            key=lambda item: (-item[1], -item[0]),
+        )
+        if after is not None:
+            ranked = [(post_id, score) for post_id, score in ranked if (score, post_id) < after]
+        return ranked[:limit]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "documents": len(self.lengths), "terms": len(self.postings),
+                "max_id": self.max_id, "caught_up_id": self.caught_up_id,
+            }
+
+index = InvertedIndex()
+
+def on_post_created(db: Session, post: models.Post):
+    if backend() == "memory":
+        db.info.setdefault(_EVENTS_KEY, []).append(("add", post.id, post.owner_id, post.content))
+
+def on_post_deleted(db: Session, post_id: int):
+    if backend() == "memory":
+        db.info.setdefault(_EVENTS_KEY, []).append(("remove", post_id, None, None))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_events(session):
+    for kind, post_id, owner_id, content in session.info.pop(_EVENTS_KEY, None) or ():
+        if kind == "add":
+            index.add(post_id, owner_id, content)
+        else:
+            index.remove(post_id)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_events(session):
+    session.info.pop(_EVENTS_KEY, None)
+
+def catch_up(db: Session):
+    # index posts committed since the last catch-up, whichever worker wrote them; ids this worker already indexed from
+    # its own commits are skipped by add(). SQLite commits ids in order, so nothing below the watermark appears later
+    rows = db.execute(
+        select(models.Post.id, models.Post.owner_id, models.Post.content)
+        .where(models.Post.id > index.caught_up_id, models.Post.deleted == False)
+        .order_by(models.Post.id)
+        .execution_options(yield_per=10000)
+    )
+    for post_id, owner_id, content in rows:
+        index.add(post_id, owner_id, content)
+        index.caught_up_id = post_id
+
+def _search_postgres(db: Session, viewer_id: int, query: str, after: Optional[pagination.RankCursor], limit: int):
+    tsquery = func.websearch_to_tsquery(SEARCH_LANGUAGE, query)
+    vector = literal_column("posts.search_vector")
+    rank = func.ts_rank(vector, tsquery).label("rank")
+    q = db.query(models.Post, rank).filter(
+        vector.op("@@")(tsquery),
+        models.Post.deleted == False,
+        blocklist.not_blocked_clause(viewer_id, models.Post.owner_id),
+    )
+    if after is not None:
+        q = q.filter(tuple_(func.ts_rank(vector, tsquery), models.Post.id) < tuple_(*after))
+    return q.order_by(rank.desc(), models.Post.id.desc()).limit(limit).all()
+
+def search(db: Session, viewer_id: int, query: str, after: Optional[pagination.RankCursor], limit: int) -> List[Tuple[models.Post, float]]:
+    if backend() == "postgres":
+        return [(post, score) for post, score in _search_postgres(db, viewer_id, query, after, limit)]
+    blocked = blocklist.get_block_set(db, viewer_id)
+    results: List[Tuple[models.Post, float]] = []
+    # the index can lag deletions made through other workers; hydrate in pages and skip what the database drops
+    while len(results) < limit:
+        ranked = index.search(query, blocked, after, limit - len(results))
+        if not ranked:
+            break
+        posts = {
+            post.id: post for post in db.query(models.Post).filter(
+                models.Post.id.in_([post_id for post_id, _ in ranked]), models.Post.deleted == False
+            )
+        }
+        results.extend((posts[post_id], score) for post_id, score in ranked if post_id in posts)
+        after = (ranked[-1][1], ranked[-1][0])
+    return results
+
+def create_search_vector(conn: Connection):
+    # the generated column is PostgreSQL-only, so it lives outside the model; added by app.migrations
+    conn.execute(text(
+        "ALTER TABLE posts ADD COLUMN IF NOT EXISTS search_vector tsvector "
+        f"GENERATED ALWAYS AS (to_tsvector('{SEARCH_LANGUAGE}', coalesce(content, ''))) STORED"
+    ))
+    conn.execute(text("CREATE INDEX IF NOT EXISTS ix_posts_search_vector ON posts USING gin (search_vector)"))
+
+def _refresh():
+    db = SessionLocal()
+    try:
+        catch_up(db)
+    finally:
+        db.close()
+
+_refresher = PeriodicTask("search-refresh", SEARCH_REFRESH_SECONDS, _refresh)
+
+def start():
+    if backend() != "memory":
+        return
+    _refresh()
+    _refresher.start()
+
+def shutdown():
+    _refresher.stop()
+
+def stats() -> dict:
+    if backend() != "memory":
+        return {"backend": backend()}
+    return dict(index.stats(), backend="memory")
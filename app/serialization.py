@@ -0,0 +1,48 @@
+import enum
+import json
+import os
+from datetime import datetime
+from typing import Iterable, List, Type
+
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+from pydantic import BaseModel
+from dotenv import load_dotenv
+
+try:
+    import orjson
+except ImportError:  # fall back to stdlib json with FastAPI's default separators
+    orjson = None
+
+load_dotenv()
+# comma-separated router names ("posts", "activities") whose list endpoints skip pydantic validation
+FAST_SERIALIZATION_ROUTERS = {
+    name.strip() for name in os.getenv("FAST_SERIALIZATION_ROUTERS", "").split(",") if name.strip()
+}
+
+def enabled(router_name: str) -> bool:
+    return router_name in FAST_SERIALIZATION_ROUTERS
+
+def columns(schema: Type[BaseModel], model) -> list:
+    # one mapped column per schema field, in schema order, so rows line up with the JSON keys
+    return [getattr(model, name) for name in schema.__fields__]
+
+def _plain(value):
+    if isinstance(value, enum.Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+def dumps(schema: Type[BaseModel], rows: Iterable) -> bytes:
+    fields = list(schema.__fields__)
+    if orjson is not None:
+        return orjson.dumps([dict(zip(fields, row)) for row in rows])
+    items: List[dict] = [dict(zip(fields, map(_plain, row))) for row in rows]
+    return json.dumps(items, ensure_ascii=False, allow_nan=False, indent=None, separators=(",", ":")).encode("utf-8")
+
+def render(schema: Type[BaseModel], rows: Iterable, fast: bool) -> bytes:
+    # rows are column tuples when fast, ORM objects otherwise; both produce the same bytes
+    if fast:
+        return dumps(schema, rows)
+    return JSONResponse(jsonable_encoder([schema.from_orm(row) for row in rows])).body
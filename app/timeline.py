@@ -0,0 +1,224 @@
+import argparse
+import heapq
+import os
+import threading
+import time
+from typing import Dict, Iterable, List, Optional
+
+from sqlalchemy import delete, func, insert, select
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models, blocklist
+
+load_dotenv()
+# accounts with more followers than this are merged in at read time instead of fanned out on write
+TIMELINE_FANOUT_MAX_FOLLOWERS = int(os.getenv("TIMELINE_FANOUT_MAX_FOLLOWERS", "5000"))
+TIMELINE_MAX_ENTRIES = int(os.getenv("TIMELINE_MAX_ENTRIES", "800"))
+# a recipient's timeline is trimmed back to TIMELINE_MAX_ENTRIES after this many entries fanned out to it by one worker
+TIMELINE_TRIM_EVERY = int(os.getenv("TIMELINE_TRIM_EVERY", "20"))
+TIMELINE_FOLLOW_BACKFILL = int(os.getenv("TIMELINE_FOLLOW_BACKFILL", "20"))
+TIMELINE_CELEBRITY_REFRESH_SECONDS = float(os.getenv("TIMELINE_CELEBRITY_REFRESH_SECONDS", "300"))
+
+_celebrities = {"loaded_at": None, "ids": frozenset()}
+_celebrities_lock = threading.Lock()
+# entries fanned out to each recipient by this worker since its timeline was last trimmed
+_untrimmed: Dict[int, int] = {}
+_untrimmed_lock = threading.Lock()
+
+def celebrity_ids(db: Session):
+    now = time.monotonic()
+    with _celebrities_lock:
+        loaded_at = _celebrities["loaded_at"]
+        if loaded_at is not None and now - loaded_at < TIMELINE_CELEBRITY_REFRESH_SECONDS:
+            return _celebrities["ids"]
+    rows = db.execute(
+        select(models.Follow.followed_id)
+        .group_by(models.Follow.followed_id)
+        .having(func.count(models.Follow.id) > TIMELINE_FANOUT_MAX_FOLLOWERS)
+    ).scalars().all()
+    ids = frozenset(rows)
+    with _celebrities_lock:
+        _celebrities["loaded_at"] = now
+        _celebrities["ids"] = ids
+    return ids
+
+def forget_celebrities():
+    with _celebrities_lock:
+        _celebrities["loaded_at"] = None
+
+def _insert_entries(db: Session, rows: List[dict]):
+    if not rows:
+        return
+    # skip (user, post) pairs that are already materialized instead of relying on IntegrityError
+    existing = set(db.execute(
+        select(models.TimelineEntry.user_id, models.TimelineEntry.post_id).where(
+            models.TimelineEntry.post_id.in_({r["post_id"] for r in rows}),
+            models.TimelineEntry.user_id.in_({r["user_id"] for r in rows}),
+        )
+    ).all())
+    rows = [r for r in rows if (r["user_id"], r["post_id"]) not in existing]
+    if rows:
+        db.execute(insert(models.TimelineEntry), rows)
+
+def trim(db: Session, user_ids: Iterable[int]):
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    ranked = select(
+        models.TimelineEntry.id,
+        func.row_number().over(
+            partition_by=models.TimelineEntry.user_id,
+            order_by=(models.TimelineEntry.created_at.desc(), models.TimelineEntry.post_id.desc()),
+        ).label("rn"),
+    ).where(models.TimelineEntry.user_id.in_(user_ids)).subquery()
+    overflow = select(ranked.c.id).where(ranked.c.rn > TIMELINE_MAX_ENTRIES)
+    db.execute(delete(models.TimelineEntry).where(models.TimelineEntry.id.in_(overflow)).execution_options(synchronize_session=False))
+
+def _due_for_trim(recipients: List[int]) -> List[int]:
+    due = []
+    with _untrimmed_lock:
+        for uid in recipients:
+            count = _untrimmed.get(uid, 0) + 1
+            if count >= TIMELINE_TRIM_EVERY:
+                due.append(uid)
+                count = 0
+            _untrimmed[uid] = count
+    return due
+
+def fan_out(db: Session, post: models.Post):
+    # the same cached set read_home_timeline merges from, so a post is either fanned out or pulled at read time
+    if post.owner_id in celebrity_ids(db):
+        follower_ids = []
+    else:
+        follower_ids = db.execute(
+            select(models.Follow.follower_id).where(models.Follow.followed_id == post.owner_id)
+        ).scalars().all()
+    recipients = [post.owner_id, *follower_ids]
+    db.execute(insert(models.TimelineEntry), [
+        {"user_id": uid, "post_id": post.id, "owner_id": post.owner_id, "created_at": post.created_at}
+        for uid in recipients
+    ])
+    if TIMELINE_TRIM_EVERY:
+        trim(db, _due_for_trim(recipients))
+
+def on_follow(db: Session, follower_id: int, followed_id: int):
+    if followed_id in celebrity_ids(db):
+        return
+    posts = db.execute(
+        select(models.Post.id, models.Post.created_at)
+        .where(models.Post.owner_id == followed_id, models.Post.deleted == False)
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+        .limit(TIMELINE_FOLLOW_BACKFILL)
+    ).all()
+    _insert_entries(db, [
+        {"user_id": follower_id, "post_id": pid, "owner_id": followed_id, "created_at": created_at}
+        for pid, created_at in posts
+    ])
+
+def on_unfollow(db: Session, follower_id: int, followed_id: int):
+    db.execute(delete(models.TimelineEntry).where(
+        models.TimelineEntry.user_id == follower_id, models.TimelineEntry.owner_id == followed_id
+    ).execution_options(synchronize_session=False))
+
+def on_block(db: Session, blocker_id: int, blocked_id: int):
+    on_unfollow(db, blocker_id, blocked_id)
+    on_unfollow(db, blocked_id, blocker_id)
+
+def on_post_deleted(db: Session, post_id: int):
+    db.execute(delete(models.TimelineEntry).where(
+        models.TimelineEntry.post_id == post_id
+    ).execution_options(synchronize_session=False))
+
+def rebuild(db: Session, user_id: int):
+    celebs = celebrity_ids(db)
+    followed = db.execute(
+        select(models.Follow.followed_id).where(models.Follow.follower_id == user_id)
+    ).scalars().all()
+    blocked = blocklist.get_block_set(db, user_id)
+    sources = [uid for uid in followed if uid not in celebs and uid not in blocked] + [user_id]
+    posts = db.execute(
+        select(models.Post.id, models.Post.owner_id, models.Post.created_at)
+        .where(models.Post.owner_id.in_(sources), models.Post.deleted == False)
+        .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+        .limit(TIMELINE_MAX_ENTRIES)
+    ).all()
+    db.execute(delete(models.TimelineEntry).where(
+        models.TimelineEntry.user_id == user_id
+    ).execution_options(synchronize_session=False))
+    if posts:
+        db.execute(insert(models.TimelineEntry), [
+            {"user_id": user_id, "post_id": pid, "owner_id": owner_id, "created_at": created_at}
+            for pid, owner_id, created_at in posts
+        ])
+    db.commit()
+    return len(posts)
+
+def read_home_timeline(db: Session, viewer: models.User, limit: int = 50) -> List[models.Post]:
+    materialized = (
+        db.query(models.Post)
+        .join(models.TimelineEntry, models.TimelineEntry.post_id == models.Post.id)
+        .filter(models.TimelineEntry.user_id == viewer.id, models.Post.deleted == False)
+        .filter(blocklist.not_blocked_clause(viewer.id, models.Post.owner_id))
+        .order_by(models.TimelineEntry.created_at.desc(), models.TimelineEntry.post_id.desc())
+        .limit(limit)
+        .all()
+    )
+    celebs = celebrity_ids(db)
+    pulled: List[models.Post] = []
+    if celebs:
+        followed_celebs = db.execute(
+            select(models.Follow.followed_id).where(
+                models.Follow.follower_id == viewer.id, models.Follow.followed_id.in_(celebs)
+            )
+        ).scalars().all()
+        if followed_celebs:
+            pulled = (
+                db.query(models.Post)
+                .filter(models.Post.owner_id.in_(followed_celebs), models.Post.deleted == False)
+                .filter(blocklist.not_blocked_clause(viewer.id, models.Post.owner_id))
+                .order_by(models.Post.created_at.desc(), models.Post.id.desc())
+                .limit(limit)
+                .all()
+            )
+    if not pulled:
+        return materialized
+    seen = set()
+    merged = []
+    key = lambda p: (p.created_at, p.id)
+    for post in heapq.merge(materialized, pulled, key=key, reverse=True):
+        if post.id in seen:
+            continue
+        seen.add(post.id)
+        merged.append(post)
+        if len(merged) == limit:
+            break
+    return merged
+
+def _cold_user_ids(db: Session) -> List[int]:
+    has_entries = select(models.TimelineEntry.user_id).where(models.TimelineEntry.user_id == models.User.id).exists()
+    return db.execute(select(models.User.id).where(~has_entries)).scalars().all()
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Rebuild materialized home timelines")
+    parser.add_argument("usernames", nargs="*", help="users to rebuild (default: every user with an empty timeline)")
+    parser.add_argument("--all", action="store_true", help="rebuild every user's timeline")
+    args = parser.parse_args(argv)
+
+    from .database import SessionLocal
+    db = SessionLocal()
+    try:
+        if args.usernames:
+            user_ids = db.execute(select(models.User.id).where(models.User.username.in_(args.usernames))).scalars().all()
+        elif args.all:
+            user_ids = db.execute(select(models.User.id)).scalars().all()
+        else:
+            user_ids = _cold_user_ids(db)
+        for user_id in user_ids:
+            count = rebuild(db, user_id)
+            print(f"user {user_id}: {count} entries")
+    finally:
+        db.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,260 @@
+import heapq
+import logging
+import math
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import delete, event, select
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models
+from .background import PeriodicTask
+from .database import SessionLocal
+
+load_dotenv()
+TRENDING_HALF_LIFE_HOURS = float(os.getenv("TRENDING_HALF_LIFE_HOURS", "6"))
+TRENDING_TOP_K = int(os.getenv("TRENDING_TOP_K", "100"))
+# likes older than this many half-lives weigh under 0.5% and are left out of rebuilds
+TRENDING_WINDOW_HALF_LIVES = float(os.getenv("TRENDING_WINDOW_HALF_LIVES", "8"))
+# how often scores are recomputed from the likes table (folding in other workers' likes) and snapshotted
+TRENDING_REFRESH_SECONDS = float(os.getenv("TRENDING_REFRESH_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+_EVENTS_KEY = "trending_events"
+_DECAY = math.log(2) / (TRENDING_HALF_LIFE_HOURS * 3600)
+# rebase before exp() grows past this exponent
+_REBASE_EXPONENT = 300.0
+# scores below this (as a decayed like count) are dropped on rebase
+_MIN_SCORE = 1e-3
+
+def _ts(value: datetime) -> float:
+    return (value - datetime(1970, 1, 1)).total_seconds()
+
+class TrendingScorer:
+    # every like adds exp(decay * (liked_at - origin)); decaying all posts at the same rate never reorders them, so
+    # scores only change on events, and the live value is the stored one times exp(-decay * (now - origin))
+    def __init__(self, top_k: int = TRENDING_TOP_K):
+        self.top_k = top_k
+        self.origin = time.time()
+        self.scores: Dict[int, float] = {}
+        self._top: set = set()
+        self._heap: List[Tuple[float, int]] = []
+        self._ranked: Optional[List[int]] = []
+        self._replay: Optional[list] = None
+        self._lock = threading.Lock()
+        self.rebuilt_at: Optional[datetime] = None
+
+    def _weight(self, at: datetime) -> float:
+        return math.exp(_DECAY * (_ts(at) - self.origin))
+
+    def apply(self, events: List[tuple]):
+        with self._lock:
+            if self._replay is not None:
+                self._replay.extend(events)
+            for kind, post_id, at, sign in events:
+                if kind == "post_deleted":
+                    self._remove(post_id)
+                else:
+                    self._add(post_id, sign * self._weight(at))
+            self._maybe_rebase()
+
+    def _add(self, post_id: int, delta: float):
+        score = self.scores.get(post_id, 0.0) + delta
+        if score <= _MIN_SCORE * self._weight(datetime.utcnow()):
+            self._remove(post_id)
+            return
+        self.scores[post_id] = score
+        if delta < 0 and post_id in self._top:
+            # a member fell; some outsider may now outrank it
+            self._recompute_top()
+            return
+        self._offer(post_id, score)
+
+    def _remove(self, post_id: int):
+        if self.scores.pop(post_id, None) is not None and post_id in self._top:
+            self._recompute_top()
+
+    def _offer(self, post_id: int, score: float):
+        if post_id in self._top:
+            heapq.heappush(self._heap, (score, post_id))
+            if len(self._heap) > 4 * self.top_k:
+                # compact the stale entries that repeated likes on members leave behind
+                self._heap = [(self.scores[member], member) for member in self._top]
+                heapq.heapify(self._heap)
+            self._ranked = None
+            return
+        if len(self._top) < self.top_k:
+            self._top.add(post_id)
+            heapq.heappush(self._heap, (score, post_id))
+            self._ranked = None
+            return
+        lowest, lowest_id = self._peek_min()
+        if score > lowest:
+            heapq.heappop(self._heap)
+            self._top.discard(lowest_id)
+            self._top.add(post_id)
+            heapq.heappush(self._heap, (score, post_id))
+            self._ranked = None
+
+    def _peek_min(self) -> Tuple[float, int]:
+        # drop heap entries left behind by score changes or evictions
+        while True:
+            score, post_id = self._heap[0]
+            if post_id in self._top and self.scores.get(post_id) == score:
+                return score, post_id
+            heapq.heappop(self._heap)
+
+    def _recompute_top(self):
+        best = heapq.nlargest(self.top_k, self.scores.items(), key=lambda item: item[1])
+        self._top = {post_id for post_id, _ in best}
+        self._heap = [(score, post_id) for post_id, score in best]
+        heapq.heapify(self._heap)
+        self._ranked = None
+
+    def _maybe_rebase(self):
+        shift = _DECAY * (time.time() - self.origin)
+        if shift < _REBASE_EXPONENT:
+            return
+        factor = math.exp(-shift)
+        self.origin = time.time()
+        self.scores = {post_id: score * factor for post_id, score in self.scores.items() if score * factor >= _MIN_SCORE}
+        self._recompute_top()
+
+    def top(self, limit: int) -> List[Tuple[int, float]]:
+        # (post_id, decayed like count) best first; cost depends only on top_k
+        with self._lock:
+            if self._ranked is None:
+                self._ranked = sorted(self._top, key=lambda post_id: self.scores[post_id], reverse=True)
+            now_factor = math.exp(-_DECAY * (time.time() - self.origin))
+            return [(post_id, self.scores[post_id] * now_factor) for post_id in self._ranked[:limit]]
+
+    def rebuild(self, db: Session, since: Optional[datetime] = None):
+        started = datetime.utcnow()
+        window_start = started - timedelta(hours=TRENDING_HALF_LIFE_HOURS * TRENDING_WINDOW_HALF_LIVES)
+        base: Dict[int, float] = {}
+        origin = time.time()
+        if since is not None:
+            # resume from a snapshot: its values are decayed like counts as of `since`. Posts deleted since then are
+            # left out; unlikes since then are not visible here and stay counted until the next refresh
+            rows = db.execute(
+                select(models.TrendingScore.post_id, models.TrendingScore.score)
+                .join(models.Post, models.Post.id == models.TrendingScore.post_id)
+                .where(models.Post.deleted == False)
+            ).all()
+            shift = math.exp(_DECAY * (_ts(since) - origin))
+            base = {post_id: score * shift for post_id, score in rows}
+            window_start = since
+        with self._lock:
+            self._replay = []
+        try:
+            likes = db.execute(
+                select(models.Like.post_id, models.Like.created_at)
+                .join(models.Post, models.Post.id == models.Like.post_id)
+                .where(models.Like.created_at > window_start, models.Like.created_at <= started, models.Post.deleted == False)
+                .execution_options(yield_per=10000)
+            )
+            for post_id, created_at in likes:
+                base[post_id] = base.get(post_id, 0.0) + math.exp(_DECAY * (_ts(created_at) - origin))
+        except Exception:
+            with self._lock:
+                self._replay = None
+            raise
+        with self._lock:
+            replay, self._replay = self._replay, None
+            self.origin = origin
+            self.scores = {post_id: score for post_id, score in base.items() if score >= _MIN_SCORE}
+            self._recompute_top()
+            self.rebuilt_at = started
+            # events committed while the likes were being read: keep the ones the query could not have seen
+            for kind, post_id, at, sign in replay:
+                if kind == "post_deleted":
+                    self._remove(post_id)
+                elif at > started:
+                    self._add(post_id, sign * self._weight(at))
+
+    def snapshot(self, db: Session):
+        with self._lock:
+            factor = math.exp(-_DECAY * (time.time() - self.origin))
+            rows = [{"post_id": post_id, "score": score * factor} for post_id, score in self.scores.items()]
+        taken_at = datetime.utcnow()
+        table = models.TrendingScore.__table__
+        # every worker snapshots on its own schedule: upsert by post id so concurrent snapshots never collide on the
+        # primary key, then drop the rows no newer snapshot has written
+        dialect = postgresql if db.get_bind().dialect.name == "postgresql" else sqlite
+        stmt = dialect.insert(table)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[table.c.post_id], set_={"score": stmt.excluded.score, "taken_at": stmt.excluded.taken_at},
+        )
+        if rows:
+            db.execute(stmt, [dict(row, taken_at=taken_at) for row in rows])
+        db.execute(delete(models.TrendingScore).where(models.TrendingScore.taken_at < taken_at))
+        db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"posts": len(self.scores), "top": len(self._top), "rebuilt_at": self.rebuilt_at}
+
+scorer = TrendingScorer()
+
+def on_like(db: Session, post_id: int, liked_at: datetime, delta: int = 1):
+    db.info.setdefault(_EVENTS_KEY, []).append(("like", post_id, liked_at, delta))
+
+def on_post_deleted(db: Session, post_id: int):
+    db.info.setdefault(_EVENTS_KEY, []).append(("post_deleted", post_id, None, 0))
+
+@event.listens_for(SessionLocal, "after_commit")
+def _apply_events(session):
+    events = session.info.pop(_EVENTS_KEY, None)
+    if events:
+        scorer.apply(events)
+
+@event.listens_for(SessionLocal, "after_rollback")
+def _discard_events(session):
+    session.info.pop(_EVENTS_KEY, None)
+
+def load():
+    # startup: a recent snapshot plus the likes since it, otherwise a rebuild over the decay window
+    db = SessionLocal()
+    try:
+        taken_at = db.execute(select(models.TrendingScore.taken_at).limit(1)).scalar()
+        if taken_at is not None and datetime.utcnow() - taken_at > timedelta(seconds=TRENDING_REFRESH_SECONDS * 2):
+            taken_at = None
+        scorer.rebuild(db, since=taken_at)
+    finally:
+        db.close()
+
+def _refresh():
+    db = SessionLocal()
+    try:
+        scorer.rebuild(db)
+        scorer.snapshot(db)
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+_refresher = PeriodicTask("trending-refresh", TRENDING_REFRESH_SECONDS, _refresh)
+
+def start():
+    try:
+        load()
+    except Exception:
+        logger.exception("trending scores could not be loaded; starting empty")
+    _refresher.start()
+
+def shutdown():
+    _refresher.stop()
+    db = SessionLocal()
+    try:
+        scorer.snapshot(db)
+    except Exception:
+        logger.exception("trending snapshot failed")
+    finally:
+        db.close()
@@ -0,0 +1,177 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Optional
+
+from sqlalchemy import and_, delete, or_, select, update
+from sqlalchemy.orm import Session
+from dotenv import load_dotenv
+
+from . import models, activity_writer, blocklist, counters, follow_graph, principal_cache, search, trending
+from .database import SessionLocal
+
+load_dotenv()
+USER_DELETION_CHUNK_SIZE = int(os.getenv("USER_DELETION_CHUNK_SIZE", "500"))
+# a running job whose worker has not reported progress for this long can be claimed again
+USER_DELETION_STALE_SECONDS = int(os.getenv("USER_DELETION_STALE_SECONDS", "300"))
+
+logger = logging.getLogger(__name__)
+
+_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="user-deletion")
+
+def _posts_deleted(db: Session, post_ids):
+    # drop the posts from this worker's in-memory indexes once the chunk commits
+    for post_id in post_ids:
+        trending.on_post_deleted(db, post_id)
+        search.on_post_deleted(db, post_id)
+
+def _likes_deleted(db: Session, like_ids):
+    # the user's likes come off the liked posts' trending scores, as an unlike would
+    likes = db.execute(select(models.Like.post_id, models.Like.created_at).where(models.Like.id.in_(like_ids))).all()
+    for post_id, liked_at in likes:
+        trending.on_like(db, post_id, liked_at, -1)
+
+# (model, rows owned by the user, column referencing a counted row, counter to decrement on that row,
+#  hook called with the ids about to be deleted, in the same transaction)
+_STEPS = [
+    (models.Like, lambda uid: models.Like.user_id == uid, models.Like.post_id, models.Post.like_count, _likes_deleted),
+    (models.Follow, lambda uid: models.Follow.follower_id == uid, models.Follow.followed_id, models.User.follower_count, None),
+    (models.Follow, lambda uid: models.Follow.followed_id == uid, models.Follow.follower_id, models.User.following_count, None),
+    (models.Block, lambda uid: or_(models.Block.blocker_id == uid, models.Block.blocked_id == uid), None, None, None),
+    (models.TimelineEntry, lambda uid: or_(models.TimelineEntry.user_id == uid, models.TimelineEntry.owner_id == uid), None, None, None),
+    (models.Like, lambda uid: models.Like.post_id.in_(select(models.Post.id).where(models.Post.owner_id == uid)), None, None, None),
+    (models.Post, lambda uid: models.Post.owner_id == uid, None, None, _posts_deleted),
+]
+
+_ACTIVE = (models.DeletionStatus.pending, models.DeletionStatus.running)
+
+def get_job(db: Session, job_id: int) -> Optional[models.UserDeletionJob]:
+    return db.query(models.UserDeletionJob).filter(models.UserDeletionJob.id == job_id).first()
+
+def _stale_before() -> datetime:
+    return datetime.utcnow() - timedelta(seconds=USER_DELETION_STALE_SECONDS)
+
+def _claimable(job_id: int):
+    Job = models.UserDeletionJob
+    return and_(Job.id == job_id, or_(
+        Job.status == models.DeletionStatus.pending,
+        and_(Job.status == models.DeletionStatus.running, Job.updated_at < _stale_before()),
+    ))
+
+def _claim(db: Session, job_id: int) -> bool:
+    result = db.execute(
+        update(models.UserDeletionJob).where(_claimable(job_id))
+        .values(status=models.DeletionStatus.running, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+    db.commit()
+    return result.rowcount == 1
+
+def _delete_chunk(db: Session, user_id: int, step) -> int:
+    model, owned, ref_col, counter, on_deleted = step
+    cols = [model.id] + ([ref_col] if ref_col is not None else [])
+    rows = db.execute(select(*cols).where(owned(user_id)).limit(USER_DELETION_CHUNK_SIZE)).all()
+    if not rows:
+        return 0
+    if counter is not None:
+        counted_ids = [row[1] for row in rows]
+        counters.bump_many(db, counter, counted_ids, -1)
+        if counter.class_ is models.User:
+            # cached principals carry follower/following counts
+            principal_cache.invalidate(*counted_ids)
+    deleted_ids = [row[0] for row in rows]
+    if on_deleted is not None:
+        on_deleted(db, deleted_ids)
+    db.execute(delete(model).where(model.id.in_(deleted_ids)).execution_options(synchronize_session=False))
+    return len(rows)
+
+def _mark_deleting(db: Session, user_id: int):
+    db.execute(
+        update(models.User).where(models.User.id == user_id).values(deleting=True)
+        .execution_options(synchronize_session=False)
+    )
+
+def _progress(db: Session, job_id: int, deleted: int):
+    db.execute(
+        update(models.UserDeletionJob).where(models.UserDeletionJob.id == job_id)
+        .values(deleted_rows=models.UserDeletionJob.deleted_rows + deleted, updated_at=datetime.utcnow())
+        .execution_options(synchronize_session=False)
+    )
+
+def run(job_id: int):
+    db = SessionLocal()
+    try:
+        if not _claim(db, job_id):
+            return
+        job = get_job(db, job_id)
+        user_id, requested_by = job.user_id, job.requested_by
+        # already set by schedule(); repeated for jobs queued before the flag existed
+        _mark_deleting(db, user_id)
+        db.commit()
+        affected = blocklist.get_block_set(db, user_id)
+        principal_cache.invalidate(user_id)
+        for step in _STEPS:
+            while True:
+                deleted = _delete_chunk(db, user_id, step)
+                if not deleted:
+                    break
+                _progress(db, job_id, deleted)
+                db.commit()
+        # other workers may have let the user act on a cached principal for up to PRINCIPAL_CACHE_TTL_SECONDS after
+        # the flag was set; sweep once more in the transaction that removes the users row
+        for step in _STEPS:
+            while True:
+                deleted = _delete_chunk(db, user_id, step)
+                if not deleted:
+                    break
+                _progress(db, job_id, deleted)
+        db.execute(delete(models.User).where(models.User.id == user_id).execution_options(synchronize_session=False))
+        follow_graph.on_user_deleted(db, user_id)
+        activity_writer.record(db, models.ActivityType.delete_user, actor_id=requested_by, target_user_id=user_id)
+        db.execute(
+            update(models.UserDeletionJob).where(models.UserDeletionJob.id == job_id)
+            .values(status=models.DeletionStatus.done, updated_at=datetime.utcnow(), finished_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+        blocklist.invalidate(user_id, *affected)
+        principal_cache.invalidate(user_id)
+    except Exception as exc:
+        logger.exception("user deletion job %s failed", job_id)
+        db.rollback()
+        db.execute(
+            update(models.UserDeletionJob).where(models.UserDeletionJob.id == job_id)
+            .values(status=models.DeletionStatus.failed, error=repr(exc), updated_at=datetime.utcnow())
+            .execution_options(synchronize_session=False)
+        )
+        db.commit()
+    finally:
+        db.close()
+
+def schedule(db: Session, user: models.User, requested_by: Optional[int] = None) -> models.UserDeletionJob:
+    job = db.query(models.UserDeletionJob).filter(
+        models.UserDeletionJob.user_id == user.id, models.UserDeletionJob.status.in_(_ACTIVE)
+    ).first()
+    if not job:
+        job = models.UserDeletionJob(user_id=user.id, username=user.username, requested_by=requested_by)
+        db.add(job)
+        _mark_deleting(db, user.id)
+        db.commit()
+        principal_cache.invalidate(user.id)
+    _executor.submit(run, job.id)
+    return job
+
+def resume_pending():
+    db = SessionLocal()
+    try:
+        job_ids = db.execute(
+            select(models.UserDeletionJob.id).where(models.UserDeletionJob.status.in_(_ACTIVE))
+        ).scalars().all()
+    finally:
+        db.close()
+    for job_id in job_ids:
+        _executor.submit(run, job_id)
+
+def shutdown():
+    _executor.shutdown(wait=False, cancel_futures=True)
@@ -1,11 +1,51 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Tuple
+
 from passlib.context import CryptContext
+from dotenv import load_dotenv
+
+load_dotenv()
+BCRYPT_ROUNDS = int(os.getenv("BCRYPT_ROUNDS", "12"))
+PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "2"))
+# hashing jobs allowed to wait for a worker before callers get PasswordHasherBusy
+PASSWORD_HASH_QUEUE_MAX = int(os.getenv("PASSWORD_HASH_QUEUE_MAX", "16"))
+PASSWORD_HASH_RETRY_AFTER = int(os.getenv("PASSWORD_HASH_RETRY_AFTER", "1"))
+
+# pinning min/max to the configured cost makes needs_update() flag hashes made with any other cost
+pwd_context = CryptContext(
+    schemes=["bcrypt"],
+    deprecated="auto",
+    bcrypt__default_rounds=BCRYPT_ROUNDS,
+    bcrypt__min_rounds=BCRYPT_ROUNDS,
+    bcrypt__max_rounds=BCRYPT_ROUNDS,
+)
+
+class PasswordHasherBusy(Exception):
+    pass
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
+# bcrypt releases the GIL, so a small dedicated thread pool keeps hashing off FastAPI's shared threadpool
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_WORKERS, thread_name_prefix="password-hash")
+_slots = threading.BoundedSemaphore(PASSWORD_HASH_WORKERS + PASSWORD_HASH_QUEUE_MAX)
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy()
+    try:
+        return _executor.submit(fn, *args).result()
+    finally:
+        _slots.release()
 
 def hash_password(password: str) -> str:
     password = password[:72]  # bcrypt safe limit
-    return pwd_context.hash(password)
+    return _run(pwd_context.hash, password)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     plain_password = plain_password[:72]
-    return pwd_context.verify(plain_password, hashed_password)
+    return _run(pwd_context.verify, plain_password, hashed_password)
+
+def verify_and_update_password(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    # returns (valid, new_hash); new_hash is set when the stored hash was made with a different cost
+    plain_password = plain_password[:72]
+    return _run(pwd_context.verify_and_update, plain_password, hashed_password)
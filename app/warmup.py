@@ -0,0 +1,48 @@
+import os
+from typing import List
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import QueuePool
+from dotenv import load_dotenv
+
+from . import auth, utils
+from .database import engine, replicas
+
+load_dotenv()
+# open pooled connections and run the first bcrypt hash and JWT round trip before the worker reports ready
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "false").lower() in ("1", "true", "yes")
+# connections opened per engine; defaults to (and is capped at) the pool size, since overflow connections would be
+# closed again as soon as they are returned
+WARMUP_CONNECTIONS = os.getenv("WARMUP_CONNECTIONS")
+
+def warm_pool(engine_: Engine) -> int:
+    pool = engine_.pool
+    # SQLite's NullPool/SingletonThreadPool keep nothing to warm
+    if not isinstance(pool, QueuePool):
+        return 0
+    count = min(int(WARMUP_CONNECTIONS), pool.size()) if WARMUP_CONNECTIONS else pool.size()
+    # hold every connection at once so the pool has to open each of them
+    connections: List = []
+    try:
+        for _ in range(count):
+            conn = engine_.connect()
+            connections.append(conn)
+            conn.exec_driver_sql("SELECT 1")
+    finally:
+        for conn in connections:
+            conn.close()
+    return count
+
+def warm_auth():
+    # loads the bcrypt backend, starts a hashing thread and builds the JWT signer
+    utils.hash_password("warm-up")
+    auth.decode_token(auth.create_access_token({"sub": "warm-up"}))
+
+def run() -> dict:
+    if not STARTUP_WARMUP:
+        return {}
+    opened = {"primary": warm_pool(engine)}
+    for i, replica in enumerate(replicas):
+        opened[f"replica_{i}"] = warm_pool(replica.engine)
+    warm_auth()
+    return opened
@@ -0,0 +1,8 @@
+import os
+
+def use_database(url: str = None):
+    # app.database reads DATABASE_URL at import time, so this must run before any app module is imported
+    if url:
+        os.environ["DATABASE_URL"] = url
+    elif not os.getenv("DATABASE_URL"):
+        os.environ["DATABASE_URL"] = "sqlite:///./bench.db"
@@ -0,0 +1,34 @@
+import argparse
+import json
+from typing import List, Optional
+
+METRICS = ("throughput_rps", "p50_ms", "p95_ms", "p99_ms", "queries_per_request")
+
+def _delta(old, new) -> str:
+    if old is None or new is None:
+        return "n/a"
+    if not old:
+        return f"{new}"
+    return f"{new} ({(new - old) / old * 100:+.1f}%)"
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Compare two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("candidate")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        base = json.load(f)
+    with open(args.candidate) as f:
+        cand = json.load(f)
+    print(f"baseline  {base.get('commit')}  {base.get('timestamp')}")
+    print(f"candidate {cand.get('commit')}  {cand.get('timestamp')}")
+    for name in sorted(set(base["scenarios"]) | set(cand["scenarios"])):
+        old = base["scenarios"].get(name, {})
+        new = cand["scenarios"].get(name, {})
+        print(name)
+        for metric in METRICS:
+            print(f"  {metric:20} {old.get(metric)} -> {_delta(old.get(metric), new.get(metric))}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,269 @@
+import argparse
+import json
+import math
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List, Optional
+
+from . import use_database
+
+class Context:
+    def __init__(self, user_ids: List[int], usernames: Dict[int, str], post_ids: List[int], admin_id: int, seed_value: int):
+        from app import auth
+        self.user_ids = user_ids
+        self.usernames = usernames
+        self.post_ids = post_ids
+        self.admin_id = admin_id
+        self._tokens = {}
+        self._auth = auth
+        self._local = threading.local()
+        self._seed = seed_value
+
+    def reseed(self, scenario: str, index: int):
+        # one generator per request, so the same request makes the same choices whichever thread runs it
+        self._local.rng = random.Random(f"{self._seed}-{scenario}-{index}")
+
+    @property
+    def rng(self) -> random.Random:
+        return self._local.rng
+
+    def headers(self, user_id: int) -> dict:
+        token = self._tokens.get(user_id)
+        if token is None:
+            token = self._tokens[user_id] = self._auth.create_access_token({"user_id": user_id})
+        return {"Authorization": f"Bearer {token}"}
+
+    def user(self) -> int:
+        return self.rng.choice(self.user_ids)
+
+    def other(self, user_id: int) -> int:
+        while True:
+            other = self.rng.choice(self.user_ids)
+            if other != user_id:
+                return other
+
+    def post(self) -> int:
+        return self.rng.choice(self.post_ids)
+
+# each scenario issues one measured request; statuses listed are expected outcomes, anything else is an error
+def _me(client, ctx):
+    return client.get("/api/users/me", headers=ctx.headers(ctx.user())), (200,)
+
+def _login(client, ctx):
+    name = ctx.usernames[ctx.user()]
+    return client.post("/api/users/login", json={"username": name, "email": f"{name}@example.com", "password": "benchpass"}), (200, 503)
+
+def _follow(client, ctx):
+    user = ctx.user()
+    other = ctx.usernames[ctx.other(user)]
+    verb = ctx.rng.choice(("follow", "unfollow"))
+    return client.post(f"/api/users/{other}/{verb}", headers=ctx.headers(user)), (200, 201, 400, 403)
+
+def _block(client, ctx):
+    user = ctx.user()
+    other = ctx.usernames[ctx.other(user)]
+    verb = ctx.rng.choice(("block", "unblock"))
+    return client.post(f"/api/users/{other}/{verb}", headers=ctx.headers(user)), (200, 201, 400)
+
+def _feed(client, ctx):
+    return client.get("/api/posts/", params={"limit": 50}, headers=ctx.headers(ctx.user())), (200,)
+
+def _timeline(client, ctx):
+    return client.get("/api/posts/timeline", headers=ctx.headers(ctx.user())), (200,)
+
+def _get_post(client, ctx):
+    return client.get(f"/api/posts/{ctx.post()}", headers=ctx.headers(ctx.user())), (200, 403, 404)
+
+def _create_post(client, ctx):
+    return client.post("/api/posts/", json={"content": "bench " * ctx.rng.randint(1, 30)}, headers=ctx.headers(ctx.user())), (200,)
+
+def _like(client, ctx):
+    verb = ctx.rng.choice(("like", "unlike"))
+    return client.post(f"/api/posts/{ctx.post()}/{verb}", headers=ctx.headers(ctx.user())), (200, 201, 400, 403, 404)
+
+def _global_activity(client, ctx):
+    return client.get("/api/activities/global", params={"limit": 50}, headers=ctx.headers(ctx.user())), (200,)
+
+def _admin_stats(client, ctx):
+    return client.get("/api/admin/stats/caches", headers=ctx.headers(ctx.admin_id)), (200,)
+
+def _admin_delete_post(client, ctx):
+    return client.delete(f"/api/admin/posts/{ctx.post()}", headers=ctx.headers(ctx.admin_id)), (200, 404)
+
+# scenarios that change the dataset (follows, blocks, likes, posts and soft deletes); later scenarios and later runs see
+# their writes, so runs are only comparable against a freshly seeded database
+MUTATING = {"users.follow", "users.block", "posts.create", "posts.like", "admin.delete_post"}
+
+SCENARIOS: Dict[str, Callable] = {
+    "users.me": _me,
+    "users.login": _login,
+    "users.follow": _follow,
+    "users.block": _block,
+    "posts.feed": _feed,
+    "posts.timeline": _timeline,
+    "posts.get": _get_post,
+    "posts.create": _create_post,
+    "posts.like": _like,
+    "activities.global": _global_activity,
+    "admin.stats": _admin_stats,
+    "admin.delete_post": _admin_delete_post,
+}
+
+_SERVER_TIMING_QUERIES = re.compile(r'desc="(\d+) queries"')
+
+def _reported_queries(response) -> Optional[int]:
+    match = _SERVER_TIMING_QUERIES.search(response.headers.get("server-timing", ""))
+    return int(match.group(1)) if match else None
+
+def percentile(sorted_values: List[float], pct: float) -> Optional[float]:
+    if not sorted_values:
+        return None
+    # nearest-rank percentile
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(pct / 100 * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def _load_context(seed_value: int) -> Context:
+    from sqlalchemy import select
+    from app import models
+    from app.database import SessionLocal
+
+    db = SessionLocal()
+    try:
+        users = db.execute(select(models.User.id, models.User.username).where(models.User.role == models.RoleEnum.user)).all()
+        post_ids = db.execute(select(models.Post.id).where(models.Post.deleted == False)).scalars().all()
+        admin_id = db.execute(select(models.User.id).where(models.User.role != models.RoleEnum.user).limit(1)).scalar()
+        if admin_id is None:
+            admin = models.User(username="bench_admin", email="bench_admin@example.com", hashed_password="!", role=models.RoleEnum.owner)
+            db.add(admin)
+            db.commit()
+            admin_id = admin.id
+    finally:
+        db.close()
+    if not users or not post_ids:
+        raise SystemExit("database has no users or posts; run python -m bench.seed first")
+    return Context([uid for uid, _ in users], dict(users), post_ids, admin_id, seed_value)
+
+def run_scenario(name: str, make_client: Callable, ctx: Context, requests: int, concurrency: int) -> dict:
+    scenario = SCENARIOS[name]
+    local = threading.local()
+    latencies: List[float] = []
+    errors = 0
+    reported: List[int] = []
+    lock = threading.Lock()
+
+    def one(index):
+        nonlocal errors
+        if not hasattr(local, "client"):
+            local.client = make_client()
+        ctx.reseed(name, index)
+        start = time.perf_counter()
+        queries = None
+        try:
+            response, expected = scenario(local.client, ctx)
+            ok = response.status_code in expected
+            queries = _reported_queries(response)
+        except Exception:
+            ok = False
+        elapsed = time.perf_counter() - start
+        with lock:
+            latencies.append(elapsed)
+            if queries is not None:
+                reported.append(queries)
+            if not ok:
+                errors += 1
+
+    wall_start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        list(pool.map(one, range(requests)))
+    wall = time.perf_counter() - wall_start
+    latencies.sort()
+    # counted per request by the instrumentation middleware, so background threads' queries are left out
+    queries_per_request = round(sum(reported) / len(reported), 2) if reported else None
+    ms = lambda value: round(value * 1000, 3) if value is not None else None
+    return {
+        "requests": requests,
+        "errors": errors,
+        "concurrency": concurrency,
+        "throughput_rps": round(requests / wall, 2) if wall else None,
+        "p50_ms": ms(percentile(latencies, 50)),
+        "p95_ms": ms(percentile(latencies, 95)),
+        "p99_ms": ms(percentile(latencies, 99)),
+        "max_ms": ms(latencies[-1] if latencies else None),
+        "queries_per_request": queries_per_request,
+        "mutates": name in MUTATING,
+    }
+
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], stderr=subprocess.DEVNULL, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Drive every router at a target concurrency and record latency/throughput")
+    parser.add_argument("--database-url", help="defaults to $DATABASE_URL, then sqlite:///./bench.db")
+    parser.add_argument("--url", help="benchmark a running server instead of the app in-process")
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS), help="comma-separated subset of: " + ", ".join(SCENARIOS))
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--out", help="results file (default bench/results/<timestamp>-<commit>.json)")
+    args = parser.parse_args(argv)
+
+    use_database(args.database_url)
+    from app.database import engine
+
+    ctx = _load_context(args.seed)
+    if args.url:
+        import httpx
+        make_client = lambda: httpx.Client(base_url=args.url, timeout=60)
+        app_context = None
+    else:
+        from fastapi.testclient import TestClient
+        from app.main import app
+        app_context = TestClient(app)
+        app_context.__enter__()
+        make_client = lambda: TestClient(app)
+
+    names = [n.strip() for n in args.scenarios.split(",") if n.strip()]
+    for name in names:
+        if name not in SCENARIOS:
+            raise SystemExit(f"unknown scenario {name}")
+    if MUTATING.intersection(names):
+        print("note: " + ", ".join(n for n in names if n in MUTATING) + " change the dataset; reseed with --drop before the next run")
+    results = {}
+    try:
+        for name in names:
+            results[name] = run_scenario(name, make_client, ctx, args.requests, args.concurrency)
+            row = results[name]
+            print(f"{name:20} rps={row['throughput_rps']:>8} p50={row['p50_ms']}ms p95={row['p95_ms']}ms p99={row['p99_ms']}ms q/req={row['queries_per_request']} errors={row['errors']}")
+    finally:
+        if app_context is not None:
+            app_context.__exit__(None, None, None)
+
+    commit = _git_commit()
+    report = {
+        "commit": commit,
+        "timestamp": datetime.utcnow().isoformat(),
+        "database": engine.dialect.name,
+        "target": args.url or "in-process",
+        "config": {"requests": args.requests, "concurrency": args.concurrency, "seed": args.seed},
+        "dataset": {"users": len(ctx.user_ids), "posts": len(ctx.post_ids)},
+        "scenarios": results,
+    }
+    out = args.out or os.path.join(
+        os.path.dirname(__file__), "results", f"{datetime.utcnow():%Y%m%dT%H%M%S}-{(commit or 'nogit')[:10]}.json"
+    )
+    os.makedirs(os.path.dirname(os.path.abspath(out)), exist_ok=True)
+    with open(out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"results written to {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+import argparse
+import bisect
+import itertools
+import random
+import time
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from . import use_database
+
+def _power_law_weights(n: int, alpha: float) -> List[float]:
+    # user at popularity rank r attracts followers/likes proportionally to r^-alpha
+    return list(itertools.accumulate((rank + 1) ** -alpha for rank in range(n)))
+
+def _pick(rng: random.Random, cum_weights: List[float]) -> int:
+    return bisect.bisect_left(cum_weights, rng.random() * cum_weights[-1])
+
+def _chunks(rows, size: int):
+    for i in range(0, len(rows), size):
+        yield rows[i:i + size]
+
+def seed(
+    users: int = 1000,
+    posts_per_user: float = 10,
+    follows_per_user: float = 30,
+    likes_per_user: float = 50,
+    block_rate: float = 0.01,
+    alpha: float = 1.1,
+    days: int = 30,
+    seed_value: int = 42,
+    chunk_size: int = 5000,
+    rebuild_timelines: bool = True,
+    drop: bool = False,
+) -> dict:
+    from sqlalchemy import insert, select
+    from app import models, utils, counters, timeline, migrations
+    from app.database import Base, SessionLocal, engine
+
+    if drop:
+        Base.metadata.drop_all(bind=engine)
+        migrations.schema_migrations.drop(bind=engine, checkfirst=True)
+    migrations.upgrade()
+    rng = random.Random(seed_value)
+    now = datetime.utcnow()
+    start = time.perf_counter()
+    # bcrypt once: every seeded account shares the password "benchpass"
+    hashed = utils.pwd_context.hash("benchpass")
+
+    db = SessionLocal()
+    try:
+        # ids are assigned by the database (keeps Postgres sequences intact); a per-run tag finds them again
+        tag = f"b{int(time.time()):x}"
+        user_rows = [
+            {
+                "username": f"{tag}_{i}",
+                "email": f"{tag}_{i}@example.com",
+                "hashed_password": hashed,
+                "role": models.RoleEnum.user,
+                "created_at": now - timedelta(days=days),
+            }
+            for i in range(users)
+        ]
+        for chunk in _chunks(user_rows, chunk_size):
+            db.execute(insert(models.User), chunk)
+        user_ids = db.execute(
+            select(models.User.id).where(models.User.username.like(f"{tag}\\_%", escape="\\")).order_by(models.User.id)
+        ).scalars().all()
+        # rank order decides popularity; shuffle so it is unrelated to id order
+        ranked = user_ids[:]
+        rng.shuffle(ranked)
+        cum = _power_law_weights(len(ranked), alpha)
+
+        follow_rows = []
+        for follower in user_ids:
+            wanted = min(len(user_ids) - 1, int(rng.expovariate(1 / follows_per_user)))
+            followed = set()
+            for _ in range(wanted * 3):
+                if len(followed) >= wanted:
+                    break
+                target = ranked[_pick(rng, cum)]
+                if target != follower:
+                    followed.add(target)
+            follow_rows.extend(
+                {"follower_id": follower, "followed_id": target, "created_at": now - timedelta(days=days)}
+                for target in followed
+            )
+        for chunk in _chunks(follow_rows, chunk_size):
+            db.execute(insert(models.Follow), chunk)
+
+        post_rows = []
+        for owner in user_ids:
+            for n in range(int(rng.expovariate(1 / posts_per_user)) if posts_per_user else 0):
+                post_rows.append({
+                    "content": f"post {n} by {owner}: " + "lorem ipsum " * rng.randint(1, 20),
+                    "owner_id": owner,
+                    "created_at": now - timedelta(seconds=rng.uniform(0, days * 86400)),
+                    "deleted": rng.random() < 0.01,
+                })
+        for chunk in _chunks(post_rows, chunk_size):
+            db.execute(insert(models.Post), chunk)
+        seeded_posts = []
+        for chunk in _chunks(user_ids, chunk_size):
+            seeded_posts.extend(db.execute(
+                select(models.Post.id, models.Post.owner_id, models.Post.created_at).where(models.Post.owner_id.in_(chunk))
+            ).all())
+
+        # likes favour posts by popular authors
+        posts_by_owner = {}
+        for pid, owner, _ in seeded_posts:
+            posts_by_owner.setdefault(owner, []).append(pid)
+        like_rows = []
+        if seeded_posts:
+            for user in user_ids:
+                liked = set()
+                for _ in range(int(rng.expovariate(1 / likes_per_user)) if likes_per_user else 0):
+                    owner_posts = posts_by_owner.get(ranked[_pick(rng, cum)])
+                    if owner_posts:
+                        liked.add(rng.choice(owner_posts))
+                like_rows.extend({"user_id": user, "post_id": pid, "created_at": now} for pid in liked)
+        for chunk in _chunks(like_rows, chunk_size):
+            db.execute(insert(models.Like), chunk)
+
+        block_pairs = set()
+        for _ in range(int(len(user_ids) * block_rate)):
+            blocker, blocked = rng.sample(user_ids, 2)
+            block_pairs.add((blocker, blocked))
+        block_rows = [{"blocker_id": a, "blocked_id": b, "created_at": now} for a, b in block_pairs]
+        for chunk in _chunks(block_rows, chunk_size):
+            db.execute(insert(models.Block), chunk)
+
+        activity_rows = [
+            {"actor_id": owner, "verb": models.ActivityType.post, "target_post_id": pid, "created_at": created_at}
+            for pid, owner, created_at in seeded_posts
+        ]
+        for chunk in _chunks(activity_rows, chunk_size):
+            db.execute(insert(models.Activity), chunk)
+        db.commit()
+
+        counters.reconcile(db)
+        if rebuild_timelines:
+            for user_id in user_ids:
+                timeline.rebuild(db, user_id)
+    finally:
+        db.close()
+
+    return {
+        "users": len(user_ids),
+        "posts": len(post_rows),
+        "follows": len(follow_rows),
+        "likes": len(like_rows),
+        "blocks": len(block_rows),
+        "seconds": round(time.perf_counter() - start, 2),
+    }
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Seed a synthetic power-law social graph for benchmarks")
+    parser.add_argument("--database-url", help="defaults to $DATABASE_URL, then sqlite:///./bench.db")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--posts-per-user", type=float, default=10)
+    parser.add_argument("--follows-per-user", type=float, default=30)
+    parser.add_argument("--likes-per-user", type=float, default=50)
+    parser.add_argument("--block-rate", type=float, default=0.01, help="blocks per user")
+    parser.add_argument("--alpha", type=float, default=1.1, help="power-law exponent for popularity")
+    parser.add_argument("--days", type=int, default=30, help="spread post timestamps over this many days")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--no-timelines", action="store_true", help="skip materializing home timelines")
+    parser.add_argument("--drop", action="store_true", help="drop and recreate all tables first")
+    args = parser.parse_args(argv)
+
+    use_database(args.database_url)
+    stats = seed(
+        users=args.users,
+        posts_per_user=args.posts_per_user,
+        follows_per_user=args.follows_per_user,
+        likes_per_user=args.likes_per_user,
+        block_rate=args.block_rate,
+        alpha=args.alpha,
+        days=args.days,
+        seed_value=args.seed,
+        rebuild_timelines=not args.no_timelines,
+        drop=args.drop,
+    )
+    print(" ".join(f"{key}={value}" for key, value in stats.items()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+import os
+
+os.environ.setdefault("DATABASE_URL", "sqlite://")
+
+from datetime import datetime
+
+import pytest
+
+from app import models, schemas, serialization
+
+POSTS = [
+    {"id": 1, "content": "plain ascii", "owner_id": 7, "created_at": datetime(2024, 1, 2, 3, 4, 5), "deleted": False, "like_count": 0},
+    {"id": 2, "content": "héllo wörld — 日本語 🎉", "owner_id": 8, "created_at": datetime(2024, 1, 2, 3, 4, 5, 678901), "deleted": False, "like_count": 12},
+    {"id": 3, "content": 'quotes " \\ newline\n tab\t ctrl\x01 sep ', "owner_id": 9, "created_at": datetime(2024, 12, 31, 23, 59, 59, 1), "deleted": True, "like_count": 3},
+]
+
+ACTIVITIES = [
+    {"id": 1, "actor_id": 7, "verb": models.ActivityType.post, "target_user_id": None, "target_post_id": 1,
+     "created_at": datetime(2024, 1, 2, 3, 4, 5), "extra": None},
+    {"id": 2, "actor_id": None, "verb": models.ActivityType.delete_user, "target_user_id": 8, "target_post_id": None,
+     "created_at": datetime(2024, 1, 2, 3, 4, 5, 120000), "extra": '{"username": "zoë"}'},
+    {"id": 3, "actor_id": 9, "verb": models.ActivityType.like, "target_user_id": None, "target_post_id": None,
+     "created_at": datetime(2024, 2, 29, 0, 0, 0, 999999), "extra": "ünïcödé ✓"},
+]
+
+@pytest.fixture(params=["orjson", "stdlib"])
+def encoder(request, monkeypatch):
+    if request.param == "orjson":
+        pytest.importorskip("orjson")
+    else:
+        monkeypatch.setattr(serialization, "orjson", None)
+    return request.param
+
+def _both(schema, model, values):
+    slow = serialization.render(schema, [model(**row) for row in values], fast=False)
+    fields = list(schema.__fields__)
+    fast = serialization.render(schema, [tuple(row[name] for name in fields) for row in values], fast=True)
+    return slow, fast
+
+def test_posts_match(encoder):
+    slow, fast = _both(schemas.PostOut, models.Post, POSTS)
+    assert fast == slow
+
+def test_activities_match(encoder):
+    slow, fast = _both(schemas.ActivityOut, models.Activity, ACTIVITIES)
+    assert fast == slow
+
+def test_empty_list_matches(encoder):
+    assert serialization.render(schemas.PostOut, [], fast=True) == serialization.render(schemas.PostOut, [], fast=False)